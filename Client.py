@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# Copyright © 2020 Qtrac Ltd. All rights reserved.
+
+'''A RemoteModel has the same query API as Model.Model but forwards
+everything to a DebFind daemon (see Daemon.py) over a Unix socket.
+
+The protocol is JSON Lines: each request is a JSON object with an "op"
+key and op-specific arguments, and each reply is one JSON object which
+has an "error" key if the request failed.
+'''
+
+import json
+import os
+import socket
+
+import Model
+
+
+# A systemwide daemon (run as root) listens in a directory only root can
+# write to; anyone else's daemon listens in their own runtime directory
+SYSTEM_SOCKET_FILENAME = '/run/debfind/debfind.sock'
+SOCKET_FILENAME = os.environ.get('DEBFIND_SOCKET') or (
+    f'{os.environ["XDG_RUNTIME_DIR"]}/debfind.sock'
+    if os.environ.get('XDG_RUNTIME_DIR') and os.geteuid() else
+    SYSTEM_SOCKET_FILENAME)
+PAGE_SIZE = 1000
+DEB_CACHE_SIZE = 10_000
+
+
+def model(onReady, *, filename=SOCKET_FILENAME, staged=False,
+          onNamesReady=None):
+    '''Returns a RemoteModel if a daemon is listening on filename, or
+    otherwise a locally loaded Model.Model (see Model.load() for staged
+    and onNamesReady)'''
+    remote = connectDaemon(filename)
+    if remote is not None:
+        onReady(f'Using the DebFind daemon with {len(remote):,d} '
+                'packages.', True)
+        if onNamesReady is not None:
+            onNamesReady()
+        return remote
+    return Model.Model(onReady, staged=staged, onNamesReady=onNamesReady)
+
+
+def connectDaemon(filename=SOCKET_FILENAME):
+    '''Returns a RemoteModel if a daemon is listening on filename or,
+    failing that (unless $DEBFIND_SOCKET is set), on the systemwide
+    socket, or otherwise None'''
+    remote = connect(filename)
+    if remote is None and filename != SYSTEM_SOCKET_FILENAME and (
+            'DEBFIND_SOCKET' not in os.environ):
+        remote = connect(SYSTEM_SOCKET_FILENAME)
+    return remote
+
+
+def connect(filename=SOCKET_FILENAME):
+    '''Returns a RemoteModel if a daemon is listening on filename, or
+    otherwise None; a socket owned by anyone but root or this user is
+    ignored, since its daemon could give false results'''
+    try:
+        if os.stat(filename).st_uid not in {0, os.geteuid()}:
+            print(f'Ignoring {filename}: it is owned by another user')
+            return None
+        return RemoteModel(filename)
+    except OSError:
+        return None
+
+
+class Error(Exception):
+    pass
+
+
+class RemoteModel:
+
+    def __init__(self, filename=SOCKET_FILENAME):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(filename)
+        except OSError:
+            self._socket.close()
+            raise
+        self._file = self._socket.makefile('rwb')
+        self._debForName = {}
+
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+    def _call(self, op, **kwargs):
+        self._file.write(json.dumps(dict(op=op, **kwargs)).encode() +
+                         b'\n')
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError('the DebFind daemon closed the '
+                                  'connection')
+        reply = json.loads(line)
+        error = reply.get('error')
+        if error is not None:
+            raise Error(error)
+        return reply
+
+
+    def load(self, onReady, *, refresh=False, staged=False,
+             onNamesReady=None):
+        '''Only root or the daemon's own user may (re)load; the daemon
+        only replies once fully loaded, so staged is ignored'''
+        self._debForName.clear()
+        try:
+            reply = self._call('load', refresh=refresh)
+        except Error as err:
+            onReady(f'Failed to refresh: {err}', True)
+        else:
+            onReady(reply['message'], True)
+        if onNamesReady is not None:
+            onNamesReady()
+
+
+    def __len__(self):
+        return self._call('len')['len']
+
+
+    @property
+    def stage(self):
+        return Model.Stage.ALL # A daemon only listens once fully loaded
+
+
+    @property
+    def allSections(self):
+        return self._call('sections')['sections']
+
+
+    @property
+    def allArchs(self):
+        return self._call('archs')['archs']
+
+
+    def archsForName(self, name):
+        return self._call('archsforname', name=name)['archs']
+
+
+    def versionsForName(self, name):
+        return [tuple(pair) for pair in self._call(
+            'versionsforname', name=name)['versions']]
+
+
+    def installedVersion(self, name):
+        return self._call('installedversion', name=name)['version']
+
+
+    def installedStates(self, names):
+        return [Model.Installed[state] for state in self._call(
+            'installedstates', names=list(names))['states']]
+
+
+    def descForName(self, name):
+        deb = self.debForName(name)
+        if deb is None:
+            return ''
+        return deb.desc
+
+
+    def debForName(self, name):
+        deb = self._debForName.get(name)
+        if deb is None:
+            self._addDebs(self._call('debs', names=[name])['debs'])
+            deb = self._debForName.get(name)
+        return deb
+
+
+    def _addDebs(self, debs):
+        if len(self._debForName) + len(debs) > DEB_CACHE_SIZE:
+            self._debForName.clear()
+        for deb in debs:
+            if deb is not None:
+                self._debForName[deb['name']] = Model.Deb(**deb)
+
+
+    @property
+    def cacheInfo(self):
+        return Model.CacheInfo(*self._call('cacheinfo')['cacheinfo'])
+
+
+    @property
+    def memoryReport(self):
+        return self._call('memoryreport')['memoryreport']
+
+
+    def enableQueryStats(self, *, slowSeconds=Model.SLOW_QUERY_SECONDS):
+        self._call('enablequerystats', slowSeconds=slowSeconds)
+
+
+    def disableQueryStats(self):
+        self._call('disablequerystats')
+
+
+    @property
+    def queryStats(self):
+        return self._call('querystats')['querystats']
+
+
+    def query(self, query, *, sectionCounts=False):
+        names = set(self.iterQuery(query))
+        if not sectionCounts:
+            return names
+        return names, self.sectionCounts(query)
+
+
+    def queryMany(self, queries, *, workers=1):
+        '''The daemon evaluates the batch; workers is ignored'''
+        return [set(names) for names in self._call(
+            'querymany', queries=[query.todict for query in queries])[
+                'names']]
+
+
+    def count(self, query):
+        return self._call('count', query=query.todict)['count']
+
+
+    def sectionCounts(self, query):
+        return self._call('sectioncounts',
+                          query=query.todict)['sectioncounts']
+
+
+    def iterQuery(self, query, *, order=Model.Order.NAME, reverse=False,
+                  limit=None, offset=0):
+        '''Fetches the names a page at a time (along with their Debs so
+        that debForName() doesn't need to ask the daemon for them)'''
+        while limit is None or limit > 0:
+            size = PAGE_SIZE if limit is None else min(limit, PAGE_SIZE)
+            debs = self._call('names', query=query.todict,
+                              order=order.name, reverse=reverse,
+                              limit=size, offset=offset)['debs']
+            self._addDebs(debs)
+            for deb in debs:
+                if deb is not None: # Dropped by a reload
+                    yield deb['name']
+            if len(debs) < size:
+                break
+            offset += size
+            if limit is not None:
+                limit -= size
@@ -7,3 +7,6 @@ CONFIG_WINDOW_X = 'Window/X'
 CONFIG_WINDOW_Y = 'Window/Y'
 ANY_SECTION = '(Any)'
 MAX_DESC_LEN = 60
+PAGE_SIZE = 100
+INSTALLED_COLOUR = '#006400' # Dark green
+UPGRADABLE_COLOUR = '#00008B' # Dark blue
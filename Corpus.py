@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# Copyright © 2020 Qtrac Ltd. All rights reserved.
+
+'''Writes a reproducible synthetic apt lists directory (Packages and
+i18n_Translation-en files) of any size for testing and benchmarking.
+
+The same seed and count always produce the same files, which may be
+compressed as apt does with, e.g., Acquire::GzipIndexes (see
+compress()). Names, sections, sizes, and descriptions follow roughly the
+distributions of Debian's main archive: about a third of packages are
+libraries, sizes are log-normal, and description words are drawn from a
+Zipf-distributed vocabulary. Packages depend on (recommend, etc.) earlier
+ones and a few virtual packages, which a few packages provide.
+'''
+
+import argparse
+import glob
+import itertools
+import math
+import os
+import random
+
+
+VOCABULARY_SIZE = 20_000
+# (section, weight) roughly as in Debian main
+SECTIONS = (('libs', 30), ('devel', 8), ('python', 6), ('utils', 6),
+            ('net', 4), ('doc', 4), ('admin', 3), ('text', 3), ('web', 3),
+            ('science', 3), ('math', 2), ('graphics', 2), ('sound', 2),
+            ('x11', 2), ('editors', 1), ('games', 2), ('perl', 2),
+            ('java', 2), ('kernel', 1), ('vcs', 1), ('database', 1),
+            ('non-free/libs', 1), ('contrib/games', 1))
+COMMON_WORDS = ('the', 'for', 'and', 'library', 'this', 'package',
+                'contains', 'files', 'development', 'support', 'module',
+                'tool', 'data', 'file', 'documentation', 'python', 'with',
+                'from', 'is', 'a', 'of', 'to', 'in', 'that', 'provides',
+                'which', 'can', 'be', 'used', 'it', 'server', 'client',
+                'plugin', 'interface', 'shared', 'runtime', 'version')
+COMPRESSORS = ('.gz', '.xz', '.bz2', '.lz4')
+VIRTUAL_PACKAGES = ('mail-transport-agent', 'x-terminal-emulator',
+                    'www-browser', 'c-compiler', 'awk', 'editor')
+# (field, probability, most entries) of the relations with earlier
+# packages
+RELATIONS = (('Pre-Depends', 0.05, 1), ('Depends', 0.5, 3),
+             ('Recommends', 0.3, 2), ('Suggests', 0.2, 2))
+_SYLLABLES = ('ba', 'ko', 'ri', 'tu', 'ne', 'sa', 'mi', 'lo', 'pe', 'zu',
+              'ka', 'di', 'mo', 've', 'gra', 'pli', 'str', 'xen', 'qua',
+              'fy', 'on', 'ex', 'ul', 'am', 'ir')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write a synthetic apt lists directory.')
+    parser.add_argument('count', type=int,
+                        help='how many packages to write, e.g., 1000 to '
+                        '1000000')
+    parser.add_argument('dirname', help='the directory to write to')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='the random seed [default: %(default)s]')
+    parser.add_argument('-f', '--files', type=int, default=4,
+                        help='how many Packages files to spread the '
+                        'packages across [default: %(default)s]')
+    parser.add_argument('-c', '--compress', choices=COMPRESSORS,
+                        help='compress the files with this suffix')
+    args = parser.parse_args()
+    size = write(args.dirname, args.count, seed=args.seed,
+                 files=args.files)
+    if args.compress:
+        compress(args.dirname, args.compress)
+    print(f'Wrote {args.count:,d} packages ({size:,d} bytes) to '
+          f'{args.dirname}')
+
+
+def write(dirname, count, *, seed=0, files=4):
+    '''Writes count packages to files Packages files and matching
+    i18n_Translation-en files in dirname and returns how many bytes
+    were written'''
+    rand = random.Random(seed)
+    # Relations are drawn separately so the other fields don't change
+    relationRand = random.Random(f'{seed}-relations')
+    names = []
+    vocabulary = _vocabulary(rand)
+    weights = list(itertools.accumulate(1 / (rank + 1) ** 1.07
+                                        for rank in range(len(vocabulary))))
+    sections, sectionWeights = zip(*SECTIONS)
+    sectionWeights = list(itertools.accumulate(sectionWeights))
+    os.makedirs(dirname, exist_ok=True)
+    size = 0
+    for i in range(files):
+        prefix = f'{dirname}/synthetic.debian.org_debian_dists_suite{i}'
+        start = count * i // files
+        end = count * (i + 1) // files
+        with open(f'{prefix}_main_binary-amd64_Packages', 'wt',
+                  encoding='utf-8') as packages, open(
+                f'{prefix}_main_i18n_Translation-en', 'wt',
+                encoding='utf-8') as translations:
+            for id in range(start, end):
+                name = _name(rand, vocabulary, weights, id)
+                section = rand.choices(sections,
+                                       cum_weights=sectionWeights)[0]
+                if name.startswith('lib') and rand.random() < 0.8:
+                    section = 'libs'
+                elif name.endswith('-doc'):
+                    section = 'doc'
+                summary, body = _description(rand, vocabulary, weights)
+                relations = _relations(relationRand, names)
+                size += packages.write(_stanza(rand, name, section,
+                                               summary, body, id,
+                                               relations))
+                names.append(name)
+                size += translations.write(_translation(name, summary,
+                                                        body))
+    return size
+
+
+def compress(dirname, suffix, *, target=None):
+    '''Compresses every file in dirname to a file with the given suffix
+    (one of COMPRESSORS; .lz4 needs the lz4 module) in target, or in place
+    of the original if target is None, and returns how many bytes were
+    written'''
+    if suffix == '.gz':
+        import gzip as module
+    elif suffix == '.xz':
+        import lzma as module
+    elif suffix == '.bz2':
+        import bz2 as module
+    else:
+        import lz4.frame as module
+    if target is not None:
+        os.makedirs(target, exist_ok=True)
+    size = 0
+    for name in sorted(glob.glob(f'{dirname}/*')):
+        filename = os.path.join(target or dirname,
+                                os.path.basename(name) + suffix)
+        with open(name, 'rb') as file, module.open(filename,
+                                                   'wb') as outfile:
+            while True:
+                data = file.read(1 << 20)
+                if not data:
+                    break
+                outfile.write(data)
+        size += os.path.getsize(filename)
+        if target is None:
+            os.remove(name)
+    return size
+
+
+def vocabulary(seed=0):
+    '''Returns the words used by write() for the given seed, most
+    frequent first'''
+    return _vocabulary(random.Random(seed))
+
+
+def _vocabulary(rand):
+    words = list(COMMON_WORDS)
+    seen = set(words)
+    while len(words) < VOCABULARY_SIZE:
+        word = ''.join(rand.choices(_SYLLABLES, k=rand.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def _name(rand, vocabulary, weights, id):
+    # The id keeps names unique; only rarer words are used in names
+    stem = rand.choices(vocabulary[len(COMMON_WORDS):],
+                        cum_weights=weights[len(COMMON_WORDS):])[0]
+    kind = rand.random()
+    if kind < 0.33:
+        return f'lib{stem}{id}{rand.choice(("", "-dev", "-dev", "c2"))}'
+    if kind < 0.41:
+        return f'python3-{stem}{id}'
+    if kind < 0.45:
+        return f'{stem}{id}-doc'
+    return f'{stem}{id}{rand.choice(("", "", "", "-utils", "-data"))}'
+
+
+def _description(rand, vocabulary, weights):
+    '''Returns a one-line summary and a list of paragraphs, each of which
+    is a list of lines, some starting with "* " as list items'''
+    summary = ' '.join(rand.choices(vocabulary, cum_weights=weights,
+                                    k=rand.randint(3, 9)))
+    body = []
+    for _ in range(max(1, round(rand.lognormvariate(0.3, 0.6)))):
+        bullets = rand.random() < 0.15
+        lines = []
+        for _ in range(rand.randint(1, 6)):
+            words = rand.choices(vocabulary, cum_weights=weights,
+                                 k=rand.randint(4, 11))
+            lines.append(('* ' if bullets else '') + ' '.join(words))
+        body.append(lines)
+    return summary, body
+
+
+def _relations(rand, names):
+    '''Returns a dict whose keys are relation fields and whose values are
+    lists of entries with earlier packages (by name) or virtual ones'''
+    relations = {}
+    if not names:
+        return relations
+    for field, probability, most in RELATIONS:
+        if rand.random() < probability:
+            relations[field] = [
+                f'{rand.choice(names)} (>= 1.0)' if rand.random() < 0.3
+                else rand.choice(names)
+                for _ in range(rand.randint(1, most))]
+    if rand.random() < 0.03:
+        relations.setdefault('Depends', []).append(
+            f'{rand.choice(VIRTUAL_PACKAGES)} | {rand.choice(names)}')
+    if rand.random() < 0.0005:
+        relations['Provides'] = [rand.choice(VIRTUAL_PACKAGES)]
+    return relations
+
+
+def _stanza(rand, name, section, summary, body, id, relations):
+    size = max(1, int(math.exp(rand.gauss(6.5, 1.8))))
+    lines = [f'Package: {name}',
+             f'Version: {rand.randint(0, 9)}.{id % 100}-'
+             f'{rand.randint(1, 5)}',
+             'Architecture: amd64',
+             'Maintainer: Synthetic Maintainer <synthetic@example.org>',
+             f'Installed-Size: {size}']
+    depends = []
+    if rand.random() < 0.7:
+        depends.append(f'libc6 (>= 2.{rand.randint(17, 36)})')
+    depends += relations.get('Depends', [])
+    for field in ('Pre-Depends', 'Depends', 'Recommends', 'Suggests',
+                  'Provides'):
+        entries = depends if field == 'Depends' else relations.get(field)
+        if entries:
+            lines.append(f'{field}: {", ".join(entries)}')
+    lines.append(f'Section: {section}')
+    lines.append('Priority: optional')
+    if rand.random() < 0.7:
+        lines.append(f'Homepage: https://{name}.example.org/')
+    lines.append(f'Description: {summary}')
+    lines.append(f'Description-md5: {rand.getrandbits(128):032x}')
+    lines.append(f'Filename: pool/main/{name[0]}/{name}/{name}_amd64.deb')
+    lines.append(f'Size: {size * 300}')
+    lines.append(f'SHA256: {rand.getrandbits(256):064x}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _translation(name, summary, body):
+    lines = [f'Package: {name}', 'Description-md5: 0',
+             f'Description-en: {summary}']
+    for i, paragraph in enumerate(body):
+        if i:
+            lines.append(' .')
+        lines += [f' {line}' for line in paragraph]
+    return '\n'.join(lines) + '\n\n'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# Copyright © 2020 Qtrac Ltd. All rights reserved.
+
+'''A DebFind daemon that holds one Model in memory and serves any number
+of concurrent GUI, CLI, or scripted clients over a Unix socket (see
+Client.py for the protocol and a client).'''
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+
+import Client
+import Model
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='debfind-daemon', description='Serve DebFind queries over a '
+        'Unix socket.')
+    parser.add_argument('-s', '--socket', default=Client.SOCKET_FILENAME,
+                        help='the socket to listen on [default: '
+                        '%(default)s]')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='report loading progress on stderr')
+    parser.add_argument('--query-stats', type=float, metavar='SECONDS',
+                        help='time the stages of every query and log those '
+                        'taking at least SECONDS (see the querystats op)')
+    parser.add_argument('--events', metavar='FILE',
+                        help="write each load's phase timings and counts "
+                        'to FILE as JSON')
+    parser.add_argument('--low-memory', action='store_true',
+                        default=Model.LOW_MEMORY,
+                        help='use less memory at some cost in query time '
+                        '[default: the DEBFIND_LOW_MEMORY environment '
+                        'variable]')
+    args = parser.parse_args()
+    Model.LOW_MEMORY = args.low_memory
+    if _isListening(args.socket):
+        raise SystemExit(f'a daemon is already listening on {args.socket}')
+    try:
+        # Only its owner (e.g., root for /run/debfind) may create sockets
+        # in the directory, and clients check the socket's owner
+        os.makedirs(os.path.dirname(os.path.abspath(args.socket)),
+                    mode=0o755, exist_ok=True)
+    except OSError as err:
+        raise SystemExit(f'failed to create the socket directory: {err}')
+    daemon = Daemon(args.socket, args.verbose, args.events,
+                    args.query_stats)
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(daemon.serve())
+
+
+class Daemon:
+
+    def __init__(self, filename, verbose=False, eventsFilename=None,
+                 slowSeconds=None):
+        self.filename = filename
+        self.verbose = verbose
+        self.eventsFilename = eventsFilename
+        self.slowSeconds = slowSeconds
+        self.events = Model.EventLog()
+        self.model = None
+        self.message = ''
+
+
+    def onEvent(self, event):
+        if self.eventsFilename is None:
+            return
+        self.events.append(event)
+        if event.phase == 'ready':
+            try:
+                with open(self.eventsFilename, 'wt',
+                          encoding='utf-8') as file:
+                    self.events.dump(file)
+            except OSError as err:
+                print(f'Failed to write events: {err}', file=sys.stderr)
+            self.events = Model.EventLog()
+
+
+    def onReady(self, message, done):
+        self.message = message
+        if self.verbose:
+            print(message, file=sys.stderr)
+
+
+    async def serve(self):
+        self.model = Model.Model(self.onReady, onEvent=self.onEvent)
+        if self.slowSeconds is not None:
+            self.model.enableQueryStats(slowSeconds=self.slowSeconds)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.filename) # Stale: see _isListening()
+        server = await asyncio.start_unix_server(self.handle,
+                                                 path=self.filename)
+        # Any local user may query but only root or this user may reload
+        os.chmod(self.filename, 0o666)
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.filename)
+
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        uid = _peerUid(writer.get_extra_info('socket'))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    # Replies are made in the executor's threads (Model
+                    # supports concurrent readers) so that a slow query
+                    # or a reload doesn't hold up the other clients
+                    reply = await loop.run_in_executor(
+                        None, self.reply, json.loads(line), uid)
+                except (ValueError, KeyError, TypeError,
+                        PermissionError) as err:
+                    reply = dict(error=f'{err.__class__.__name__}: {err}')
+                except Exception as err: # Keep serving this client
+                    print(f'Failed to reply to {line!r}: {err!r}',
+                          file=sys.stderr)
+                    reply = dict(error=f'{err.__class__.__name__}: {err}')
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+    def reply(self, request, uid=None):
+        '''uid is the client's user ID (None if unknown)'''
+        op = request['op']
+        model = self.model
+        if op == 'names':
+            query = Model.Query.fromdict(request['query'])
+            names = model.iterQuery(
+                query, order=Model.Order[request.get('order', 'NAME')],
+                reverse=request.get('reverse', False),
+                limit=request.get('limit'), offset=request.get('offset', 0))
+            # A reload may have dropped a name since it was found
+            return dict(debs=[_asdict(model.debForName(name))
+                              for name in names])
+        if op == 'querymany':
+            return dict(names=[sorted(names) for names in model.queryMany(
+                [Model.Query.fromdict(query)
+                 for query in request['queries']])])
+        if op == 'debs':
+            return dict(debs=[_asdict(model.debForName(name))
+                              for name in request['names']])
+        if op == 'count':
+            return dict(count=model.count(
+                Model.Query.fromdict(request['query'])))
+        if op == 'sectioncounts':
+            return dict(sectioncounts=model.sectionCounts(
+                Model.Query.fromdict(request['query'])))
+        if op == 'sections':
+            return dict(sections=sorted(model.allSections))
+        if op == 'archs':
+            return dict(archs=sorted(model.allArchs))
+        if op == 'archsforname':
+            return dict(archs=model.archsForName(request['name']))
+        if op == 'versionsforname':
+            return dict(versions=model.versionsForName(request['name']))
+        if op == 'installedversion':
+            return dict(version=model.installedVersion(request['name']))
+        if op == 'installedstates':
+            return dict(states=[state.name for state in
+                                model.installedStates(request['names'])])
+        if op == 'len':
+            return dict(len=len(model))
+        if op == 'cacheinfo':
+            return dict(cacheinfo=list(model.cacheInfo))
+        if op == 'memoryreport':
+            return dict(memoryreport=model.memoryReport)
+        if op == 'querystats':
+            # The slow query log has every user's queries
+            _checkPrivileged(uid, op)
+            return dict(querystats=model.queryStats)
+        if op == 'enablequerystats':
+            _checkPrivileged(uid, op)
+            model.enableQueryStats(slowSeconds=request.get(
+                'slowSeconds', Model.SLOW_QUERY_SECONDS))
+            return {}
+        if op == 'disablequerystats':
+            _checkPrivileged(uid, op)
+            model.disableQueryStats()
+            return {}
+        if op == 'load':
+            # Any user could otherwise force expensive rebuilds
+            _checkPrivileged(uid, op)
+            if request.get('refresh', False):
+                # The Model carries on serving its current index while the
+                # new one is built
+                model.load(self.onReady, refresh=True, onEvent=self.onEvent)
+            return dict(message=self.message)
+        raise KeyError(f'unknown op {op!r}')
+
+
+def _asdict(deb):
+    return None if deb is None else deb._asdict()
+
+
+def _checkPrivileged(uid, op):
+    '''Raises PermissionError unless uid is root's or the daemon's'''
+    if uid not in {0, os.geteuid()}:
+        raise PermissionError("only root or the daemon's user may use "
+                              f'{op}')
+
+
+def _peerUid(sock):
+    '''Returns the user ID of the process at the other end of the Unix
+    socket, or None if it can't be found'''
+    if sock is None or not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    try:
+        _, uid, _ = struct.unpack('3i', sock.getsockopt(
+            socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+        return uid
+    except OSError:
+        return None
+
+
+def _isListening(filename):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(filename)
+            return True
+        except OSError:
+            return False
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# Copyright © 2020 Qtrac Ltd. All rights reserved.
+
+'''A command line front-end for DebFind that doesn't need wx or a display.
+Matching packages are streamed to stdout as text or as JSON Lines.'''
+
+import argparse
+import contextlib
+import functools
+import json
+import operator
+import sys
+
+import Client
+import Model
+
+
+def main():
+    args = parseArgs()
+    if args.build_index:
+        buildIndex(args)
+        return
+    model = None
+    if args.profile:
+        Model.PROFILE_DIR = args.profile
+    Model.LOW_MEMORY = args.low_memory
+    if not (args.local or args.refresh or args.events or args.profile):
+        model = Client.connectDaemon()
+    if model is None:
+        events = Model.EventLog() if args.events else None
+        model = Model.Model(onReady if args.verbose else _ignore,
+                            refresh=args.refresh, onEvent=events)
+        if events is not None:
+            with open(args.events, 'wt', encoding='utf-8') as file:
+                events.dump(file)
+    query = queryForArgs(args)
+    if args.query_stats and isinstance(model, Model.Model):
+        model.enableQueryStats(slowSeconds=0) # Log this query's plan
+    profiling = contextlib.nullcontext()
+    if args.profile:
+        import Profiler # Only imported if needed since it is slow to import
+        profiling = Profiler.profile(args.profile, 'query')
+    with profiling:
+        try:
+            if args.count:
+                print(model.count(query))
+            else:
+                write = writeJson if args.json else writeText
+                for name in model.iterQuery(query, order=args.order,
+                                            reverse=args.reverse,
+                                            limit=args.limit,
+                                            offset=args.offset):
+                    write(model.debForName(name))
+            sys.stdout.flush()
+            if args.query_stats:
+                # A daemon's stats are for all its queries if it has them
+                # (and only root or its user may read them)
+                try:
+                    json.dump(model.queryStats, sys.stderr, indent=1)
+                    print(file=sys.stderr)
+                except Client.Error as err:
+                    print(f'Failed to read query stats: {err}',
+                          file=sys.stderr)
+            if args.memory_report:
+                json.dump(model.memoryReport, sys.stderr, indent=1)
+                print(file=sys.stderr)
+        except BrokenPipeError: # e.g., piped into head
+            sys.stderr.close() # Avoid a second error on exit
+            raise SystemExit(1)
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(
+        prog='debfind', description='Find Debian packages.')
+    parser.add_argument('words', nargs='*', metavar='WORD',
+                        help='word to match in names and descriptions')
+    parser.add_argument('-a', '--any', action='store_true',
+                        help='match any of the WORDs rather than all')
+    parser.add_argument('-n', '--name', action='append', default=[],
+                        metavar='WORD', help='word to match in names only '
+                        '(may be repeated)')
+    parser.add_argument('-A', '--name-any', action='store_true',
+                        help='match any of the --name WORDs rather than all')
+    parser.add_argument('-s', '--section', default='',
+                        help='only match packages in this section')
+    parser.add_argument('--arch', default='',
+                        help='only match packages available for this '
+                        'architecture (e.g., arm64)')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('-i', '--installed', dest='installed',
+                       action='store_const', const=Model.Installed.INSTALLED,
+                       default=Model.Installed.ANY,
+                       help='only match installed packages')
+    group.add_argument('-I', '--not-installed', dest='installed',
+                       action='store_const',
+                       const=Model.Installed.NOT_INSTALLED,
+                       help='only match packages that are not installed')
+    group.add_argument('-u', '--upgradable', dest='installed',
+                       action='store_const',
+                       const=Model.Installed.UPGRADABLE,
+                       help='only match installed packages that have a '
+                       'higher version available')
+    parser.add_argument('--depends-on', default='', metavar='PACKAGE',
+                        help='only match packages that depend on PACKAGE')
+    parser.add_argument('--required-by', default='', metavar='PACKAGE',
+                        help='only match packages that PACKAGE depends on')
+    relations = ','.join(relation.name.lower().replace('_', '-')
+                         for relation in Model.Relation
+                         if relation in Model.DEFAULT_RELATIONS)
+    parser.add_argument('--relations', default=relations,
+                        help='the comma-separated relations that count '
+                        'for --depends-on and --required-by (of depends, '
+                        'pre-depends, recommends, and suggests) '
+                        '[default: %(default)s]')
+    parser.add_argument('--transitive', action='store_true',
+                        help='for --depends-on and --required-by count '
+                        'indirect dependencies too')
+    parser.add_argument('-l', '--libs', action='store_true',
+                        help='include libraries')
+    parser.add_argument('-d', '--docs', action='store_true',
+                        help='include documentation packages')
+    parser.add_argument('--min-size', type=int, metavar='KIB',
+                        help='minimum Installed-Size in KiB')
+    parser.add_argument('--max-size', type=int, metavar='KIB',
+                        help='maximum Installed-Size in KiB')
+    parser.add_argument('-o', '--order', default='name',
+                        choices=[order.name.lower()
+                                 for order in Model.Order],
+                        help='result order [default: %(default)s]')
+    parser.add_argument('-r', '--reverse', action='store_true',
+                        help='reverse the order')
+    parser.add_argument('--limit', type=int,
+                        help='output at most this many packages')
+    parser.add_argument('--offset', type=int, default=0,
+                        help='skip this many packages first')
+    parser.add_argument('-c', '--count', action='store_true',
+                        help='only output the number of matches')
+    parser.add_argument('-j', '--json', action='store_true',
+                        help='output JSON Lines rather than text')
+    parser.add_argument('--refresh', action='store_true',
+                        help='reread the Packages files ignoring the cache '
+                        '(implies --local)')
+    parser.add_argument('--local', action='store_true',
+                        help='load the index even if a DebFind daemon is '
+                        'running')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='report loading progress on stderr')
+    parser.add_argument('--query-stats', action='store_true',
+                        help="write the query's stage times and plan (or "
+                        "a daemon's query stats) to stderr as JSON")
+    parser.add_argument('--memory-report', action='store_true',
+                        help="write the index's memory use (of the daemon "
+                        'if there is one) to stderr as JSON')
+    parser.add_argument('--low-memory', action='store_true',
+                        default=Model.LOW_MEMORY,
+                        help='use less memory at some cost in query time '
+                        'if not using a daemon [default: the '
+                        'DEBFIND_LOW_MEMORY environment variable]')
+    parser.add_argument('--events', metavar='FILE',
+                        help="write the load's phase timings and counts to "
+                        'FILE as JSON (implies --local)')
+    parser.add_argument('--profile', metavar='DIR',
+                        default=Model.PROFILE_DIR,
+                        help='profile loading and the query (time and '
+                        'memory) into DIR (implies --local) [default: '
+                        'the DEBFIND_PROFILE environment variable]')
+    parser.add_argument('--build-index', action='store_true',
+                        help='read and index the Packages files and write '
+                        'the systemwide index (normally run as root by '
+                        'APT after an update) to '
+                        f'{Model.SYSTEM_INDEX_FILENAME}')
+    args = parser.parse_args()
+    args.order = Model.Order[args.order.upper()]
+    try:
+        args.relations = functools.reduce(operator.or_, (
+            Model.Relation[name.strip().upper().replace('-', '_')]
+            for name in args.relations.split(',')), Model.Relation(0))
+    except KeyError as err:
+        parser.error(f'unknown relation {err}')
+    return args
+
+
+def buildIndex(args):
+    try:
+        Model.buildIndex(onReady if args.verbose else _ignore)
+    except (ValueError, OSError) as err:
+        raise SystemExit(f'failed to build the index: {err}')
+
+
+def queryForArgs(args):
+    return Model.Query(
+        section=args.section, descWords=' '.join(args.words),
+        descMatch=Model.Match.ANY_WORD if args.any else
+        Model.Match.ALL_WORDS, nameWords=' '.join(args.name),
+        nameMatch=Model.Match.ANY_WORD if args.name_any else
+        Model.Match.ALL_WORDS, includeLibs=args.libs,
+        includeDocs=args.docs, minSize=args.min_size,
+        maxSize=args.max_size, arch=args.arch, installed=args.installed,
+        dependsOn=args.depends_on, requiredBy=args.required_by,
+        relations=args.relations, transitive=args.transitive)
+
+
+def writeText(deb):
+    print(f'{deb.name} - {_summary(deb.desc)}')
+
+
+def writeJson(deb):
+    print(json.dumps(dict(name=deb.name, version=deb.version,
+                          section=deb.section, size=deb.size,
+                          url=deb.url, summary=_summary(deb.desc)),
+                     ensure_ascii=False))
+
+
+def onReady(message, done):
+    print(message, file=sys.stderr)
+
+
+def _ignore(message, done):
+    pass
+
+
+def _summary(desc):
+    return desc.split('\n', 1)[0].strip()
+
+
+if __name__ == '__main__':
+    main()
@@ -28,17 +28,29 @@ class DebView(wx.html.HtmlWindow):
         return super().OnCellClicked(cell, x, y, event)
 
 
-    def showDeb(self, deb):
+    def showDeb(self, deb, versions=(), installedVersion=''):
+        '''versions is a list of (version, suite) 2-tuples, the shown
+        version's first; installedVersion is '' if it isn't installed'''
         size = sizeof_fmt(deb.size, decs=0)
         shortDesc, desc = deb.desc.split('\n', 1)
         shortDesc = html.escape(shortDesc)
         desc = ('<p>' + html.escape(desc).replace('\v+', '<ul>')
                 .replace('\t', '<li>').replace('\v-', '</ul>')
                 .replace('\n', '</p><p>') + '</p>')
+        suite = others = ''
+        if versions:
+            suite = f' ({html.escape(versions[0][1])})'
+            if len(versions) > 1:
+                others = OTHERS.format(', '.join(
+                    f'v{html.escape(version)} ({html.escape(suite)})'
+                    for version, suite in versions[1:]))
+        installed = (f' &bull; installed v{html.escape(installedVersion)}'
+                     if installedVersion else '')
         self.SetPage(DEB.format(
             name=html.escape(deb.name), version=html.escape(deb.version),
-            size=size, url=deb.url, section=html.escape(deb.section),
-            shortDesc=shortDesc, desc=desc))
+            suite=suite, installed=installed, size=size, url=deb.url,
+            section=html.escape(deb.section), shortDesc=shortDesc,
+            desc=desc, others=others))
 
 
 def sizeof_fmt(num, *, decs=3, suffix='B'):
@@ -58,5 +70,9 @@ DEB = '''<html><body><body style="background-color: white;">
 <p><center><font color="navy">{shortDesc}</font></center></p>
 {desc}
 <p><center><font color="darkgreen"><u>{url}</u></font></center></p>
-<p><center>v{version} &bull; {size} &bull; {section}</center></p>
-</body></html>'''
+<p><center>v{version}{suite}{installed} &bull; {size} &bull; {section}
+</center></p>
+{others}</body></html>'''
+
+OTHERS = '''<p><center><font color="gray">Also: {}</font></center></p>
+'''
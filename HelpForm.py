@@ -24,7 +24,8 @@ found. Click Any Words if any matching word will do.
 <p>
 If you want to search within a particular section choose a section; if you
 want to find libraries as well as applications, check the Include Libraries
-check box.
+check box. Installed packages are listed in green, or in blue if a newer
+version is available.
 </p>
 <p>
 At startup on the first run of the session, DebFind reads and indexes all
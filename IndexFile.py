@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# Copyright © 2020 Qtrac Ltd. All rights reserved.
+
+'''An index file holds named parts (string lists, arrays, Postings, and
+str → Postings dicts) in a flat binary form that read() maps into memory
+rather than unpickling. The kernel shares a mapped file's pages between
+every process that maps it, so any number of DebFind processes can use
+one copy of the index: only the Postings of the terms actually queried
+are decoded into each process's own memory.
+
+write() replaces the file atomically, so a process that already has the
+old file mapped carries on using it until it lets go of it (the kernel
+only frees an unlinked file's pages when its last mapping is closed).
+'''
+
+import array
+import bisect
+import collections.abc
+import contextlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import weakref
+
+from Postings import Postings
+
+
+MAGIC = b'DEBFIND\0'
+
+_HEADER = struct.Struct('<8sIII') # magic, version, byte order, count
+_PART = struct.Struct('<16sBc6xQQ') # name, kind, typecode, offset, size
+_COUNT = struct.Struct('=Q')
+_ALIGN = 8
+_BYTE_ORDER = 0 if sys.byteorder == 'little' else 1 # Arrays are native
+
+_STRINGS = 0
+_ARRAY = 1
+_POSTINGS = 2
+_POSTINGS_TABLE = 3
+
+
+def write(filename, parts, version):
+    '''Writes the parts dict to filename, atomically replacing any
+    existing file. parts' keys are names of at most 16 ASCII characters
+    and its values are lists of strs, arrays, Postings, or dicts whose
+    keys are strs and whose values are Postings.'''
+    blobs = []
+    for name, value in parts.items():
+        typecode = b'\0'
+        if isinstance(value, array.array):
+            kind = _ARRAY
+            typecode = value.typecode.encode('ascii')
+            data = value.tobytes()
+        elif isinstance(value, Postings):
+            kind = _POSTINGS
+            data = value.tobytes()
+        elif isinstance(value, dict):
+            kind = _POSTINGS_TABLE
+            data = _postingsTableBytes(value)
+        else:
+            kind = _STRINGS
+            data = _stringsBytes(value)
+        blobs.append((name.encode('ascii'), kind, typecode, data))
+    offset = _HEADER.size + (_PART.size * len(blobs))
+    directory = [_HEADER.pack(MAGIC, version, _BYTE_ORDER, len(blobs))]
+    for name, kind, typecode, data in blobs:
+        offset = _aligned(offset)
+        directory.append(_PART.pack(name, kind, typecode, offset,
+                                    len(data)))
+        offset += len(data)
+    fh, tempname = tempfile.mkstemp(dir=os.path.dirname(filename) or '.',
+                                    prefix='.debfind-')
+    try:
+        with os.fdopen(fh, 'wb') as file:
+            file.write(b''.join(directory))
+            for _, _, _, data in blobs:
+                file.write(bytes(_aligned(file.tell()) - file.tell()))
+                file.write(data)
+        os.chmod(tempname, 0o644) # Every user may map it
+        os.replace(tempname, filename)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tempname)
+        raise
+
+
+def read(filename, version, *, unmapped=()):
+    '''Returns a dict of the parts in filename (mapped read-only), or
+    raises OSError or ValueError. Lists of strs are returned as
+    StringTables (or as FileStringTables if their names are in
+    unmapped), arrays as memoryviews, Postings as Postings, and dicts as
+    PostingsTables.'''
+    with open(filename, 'rb') as file:
+        try:
+            view = memoryview(mmap.mmap(file.fileno(), 0,
+                                        access=mmap.ACCESS_READ))
+        except ValueError as err: # e.g., an empty file
+            raise ValueError(f'{filename}: {err}') from None
+        fd = os.dup(file.fileno()) if unmapped else None
+    try:
+        magic, fileVersion, byteOrder, count = _HEADER.unpack_from(view)
+        if magic != MAGIC or byteOrder != _BYTE_ORDER:
+            raise ValueError(f'{filename}: not a DebFind index file for '
+                             'this machine')
+        if fileVersion != version:
+            raise ValueError(f'{filename}: index file version '
+                             f'{fileVersion} (expected {version})')
+        parts = {}
+        for i in range(count):
+            name, kind, typecode, offset, size = _PART.unpack_from(
+                view, _HEADER.size + (i * _PART.size))
+            if offset + size > len(view):
+                raise ValueError(f'{filename}: truncated index file')
+            data = view[offset:offset + size]
+            name = name.rstrip(b'\0').decode('ascii')
+            if kind == _ARRAY:
+                parts[name] = data.cast(typecode.decode('ascii'))
+            elif kind == _POSTINGS:
+                parts[name] = Postings.frombytes(data)
+            elif kind == _POSTINGS_TABLE:
+                parts[name] = PostingsTable(data)
+            elif name in unmapped:
+                parts[name] = FileStringTable(data, fd, offset)
+            else:
+                parts[name] = StringTable(data)
+        return parts
+    except struct.error as err:
+        raise ValueError(f'{filename}: {err}') from None
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+class StringTable(collections.abc.Sequence):
+    '''A read-only sequence of strs decoded on demand from a mapped
+    buffer'''
+
+    def __init__(self, view):
+        (count,) = _COUNT.unpack_from(view)
+        end = _COUNT.size * (count + 2)
+        self._offsets = view[_COUNT.size:end].cast('Q')
+        self._data = view[end:]
+
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+            if index < 0:
+                raise IndexError('StringTable index out of range')
+        offsets = self._offsets # Raises IndexError if index is too big
+        return self._string(offsets[index], offsets[index + 1])
+
+
+    @property
+    def nbytes(self):
+        '''Returns the number of mapped bytes'''
+        return self._offsets.nbytes + self._data.nbytes
+
+
+    def _string(self, start, end):
+        return str(self._data[start:end], 'utf-8')
+
+
+    def find(self, value):
+        '''Returns the index of value if this table is sorted and holds
+        it; otherwise returns -1'''
+        index = bisect.bisect_left(self, value)
+        if index < len(self) and self[index] == value:
+            return index
+        return -1
+
+
+class FileStringTable(StringTable):
+    '''A StringTable whose strs are read from the file when needed
+    rather than through the mapping, so that they never add to the
+    process's resident memory (only its offsets are mapped)'''
+
+    def __init__(self, view, fd, offset):
+        super().__init__(view)
+        # Its own descriptor keeps the (possibly since replaced) file open
+        self._fd = os.dup(fd)
+        weakref.finalize(self, os.close, self._fd)
+        self._start = offset + (view.nbytes - self._data.nbytes)
+        self._data = None
+
+
+    @property
+    def nbytes(self):
+        return self._offsets.nbytes
+
+
+    def _string(self, start, end):
+        return str(os.pread(self._fd, end - start, self._start + start),
+                   'utf-8')
+
+
+class PostingsTable(collections.abc.Mapping):
+    '''A read-only str → Postings mapping whose Postings are decoded on
+    demand from a mapped buffer'''
+
+    def __init__(self, view):
+        (size,) = _COUNT.unpack_from(view)
+        start = _COUNT.size
+        self._keys = StringTable(view[start:start + size])
+        start = _aligned(start + size)
+        end = start + (_COUNT.size * (len(self._keys) + 1))
+        self._offsets = view[start:end].cast('Q')
+        self._data = view[end:]
+
+
+    def __len__(self):
+        return len(self._keys)
+
+
+    def __iter__(self):
+        return iter(self._keys)
+
+
+    def __contains__(self, key):
+        return self._keys.find(key) != -1
+
+
+    def __getitem__(self, key):
+        index = self._keys.find(key)
+        if index == -1:
+            raise KeyError(key)
+        return Postings.frombytes(self._data[self._offsets[index]:
+                                             self._offsets[index + 1]])
+
+
+    @property
+    def nbytes(self):
+        '''Returns the number of mapped bytes'''
+        return (self._keys.nbytes + self._offsets.nbytes +
+                self._data.nbytes)
+
+
+    def nbytesFor(self, key):
+        '''Returns the number of mapped bytes of key's Postings'''
+        index = self._keys.find(key)
+        if index == -1:
+            raise KeyError(key)
+        return self._offsets[index + 1] - self._offsets[index]
+
+
+def _stringsBytes(strings):
+    data = [string.encode('utf-8') for string in strings]
+    offsets = array.array('Q', [0])
+    for datum in data:
+        offsets.append(offsets[-1] + len(datum))
+    return b''.join([_COUNT.pack(len(data)), offsets.tobytes()] + data)
+
+
+def _postingsTableBytes(postingsForKey):
+    keys = sorted(postingsForKey)
+    keyData = _stringsBytes(keys)
+    data = [postingsForKey[key].tobytes() for key in keys]
+    offsets = array.array('Q', [0])
+    for datum in data:
+        offsets.append(offsets[-1] + len(datum))
+    padding = bytes(_aligned(len(keyData)) - len(keyData))
+    return b''.join([_COUNT.pack(len(keyData)), keyData, padding,
+                     offsets.tobytes()] + data)
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
@@ -1,36 +1,138 @@
 #!/usr/bin/env python3
 # Copyright © 2020 Qtrac Ltd. All rights reserved.
 
+import array
+import bisect
 import collections
-import concurrent.futures
+import collections.abc
 import contextlib
+import copy
 import datetime
 import enum
 import fnmatch
+import functools
+import gc
 import glob
+import io
+import itertools
+import json
+import operator
 import os
 import pickle
+import queue
+import resource
 import sys
 import tempfile
+import threading
 import time
+import zlib
 
-import regex as re
-import Stemmer
+import IndexFile
+from Postings import Postings
+
+# concurrent.futures, multiprocessing, regex, Stemmer, Profiler, and the
+# decompressors are imported where they're used so that importing Model
+# (e.g., by the GUI before it shows its window, or by a client) is quick
 
 
 DATA_DIR = '/var/lib/apt/lists'
 PACKAGE_PATTERN = '*Packages'
 DESC_PATTERN = '*i18n_Translation-en'
+# The dpkg database of installed packages: it is (re)read when a query or
+# the installed state needs it and it has changed since it was last read
+DPKG_STATUS_FILENAME = '/var/lib/dpkg/status'
+# Lists matching the patterns may be compressed (.lz4 needs python3-lz4)
+COMPRESSION_SUFFIXES = ('.gz', '.xz', '.bz2', '.lz4')
+# Compressed lists at least this big are decompressed by a thread while
+# they're parsed (if there's more than one CPU)
+PIPELINE_MIN_SIZE = 1 << 20
+PIPELINE_CHUNK_SIZE = 1 << 20 # Decompressed bytes read ahead at a time
+PIPELINE_CHUNKS = 4 # How many chunks may be read ahead of the parser
+# The Debian architecture whose variant of a package is shown if it is
+# available for more than one; None means this machine's
+NATIVE_ARCH = None
+ALL_ARCH = 'all' # Architecture-independent packages match every arch
+CACHE_VERSION = 12
+# Built by buildIndex() (e.g., from an APT post-update hook) and preferred
+# to the per-user cache while it is newer than all of DATA_DIR's files
+SYSTEM_INDEX_FILENAME = os.environ.get('DEBFIND_SYSTEM_INDEX',
+                                       '/var/cache/debfind/index')
+CACHE_DIR = None # The per-user cache's directory; None means tempdir
+# If set, every load is profiled into this directory (see Profiler.py)
+PROFILE_DIR = os.environ.get('DEBFIND_PROFILE')
+PROGRESS_SECONDS = 0.25 # Minimum time between progress reports
+QUERY_CACHE_SIZE = 256
+# Low-memory mode builds the index in a child process, reads descriptions
+# from disk rather than mapping them, and compresses cached query results
+LOW_MEMORY = bool(os.environ.get('DEBFIND_LOW_MEMORY'))
+LOW_MEMORY_QUERY_CACHE_SIZE = 32
+# Match sets smaller than 1/SORT_FRACTION of all the packages are sorted by
+# rank; larger ones are produced by walking the precomputed ordering
+SORT_FRACTION = 16
+SLOW_QUERY_SECONDS = 0.1
+SLOW_QUERY_LOG_SIZE = 100
+# The query stages timed by enableQueryStats(); each histogram's bucket i
+# counts the stage times t (in μs) for which 2**(i - 1) <= t < 2**i
+QUERY_STAGES = ('stem', 'lookup', 'intersect', 'filter', 'result', 'total')
+HISTOGRAM_BUCKETS = 25
+
+
+CacheInfo = collections.namedtuple(
+    'CacheInfo', ('hits', 'misses', 'maxsize', 'currsize'))
+
+
+# Sent to load()'s onEvent callback at the end of each phase: seconds is
+# the phase's duration (for parse and ipc, the sum over all the worker
+# processes), elapsed is the time since the load began, items and bytes
+# are how many files, stanzas, packages, etc., and how many bytes the
+# phase processed, and peakMemory is the process's peak RSS in bytes.
+# A staged load (see Model.load()) sends namesReady once names and
+# sections can be searched and descs once the descriptions are indexed.
+PhaseEvent = collections.namedtuple(
+    'PhaseEvent', ('phase', 'seconds', 'elapsed', 'items', 'bytes',
+                   'peakMemory'))
+
+
+_WorkerStats = collections.namedtuple(
+    '_WorkerStats', ('seconds', 'pickleSeconds', 'bytes', 'items'))
+
+
+# Canonical form of a Query: descStems and nameStems are None if
+# unconstrained, else sorted tuples of unique stemmed words; minSize and
+# maxSize are None if unconstrained; arch, dependsOn, and requiredBy are
+# '' if unconstrained
+_QueryKey = collections.namedtuple(
+    '_QueryKey', ('section', 'descStems', 'descMatch', 'nameStems',
+                  'nameMatch', 'includeLibs', 'includeDocs', 'minSize',
+                  'maxSize', 'arch', 'installed', 'dependsOn',
+                  'requiredBy', 'relations', 'transitive'))
 
 
 Deb = collections.namedtuple(
     'Deb', ('name', 'version', 'section', 'desc', 'url', 'size'))
 
 
+# What _readPackages() reads (see _merge()): debForName has one Deb per
+# name (the candidate); namesForArch's keys are architectures and its
+# values the sets of names available for each; suiteForName's values are
+# the candidates' suites; versionsForName has the names with more than
+# one version and lists of their (version, suite) 2-tuples; and
+# relationsForName's values are the candidates' _RELATION_FIELDS values
+_Packages = collections.namedtuple(
+    '_Packages', ('debForName', 'namesForArch', 'suiteForName',
+                  'versionsForName', 'relationsForName'))
+
+
+# A dependency graph in compressed sparse row form: the IDs an ID has
+# edges to are ids[offsets[ID]:offsets[ID + 1]] (in ascending order) and
+# the Relation values of each edge are in kinds at the same indexes
+_Graph = collections.namedtuple('_Graph', ('offsets', 'ids', 'kinds'))
+
+
 @enum.unique
-class FutureKind(enum.Enum):
-    DEBS = 0
-    DESCS = 1
+class Stage(enum.Enum):
+    NAMES = 1 # Only names and sections can be searched
+    ALL = 2
 
 
 @enum.unique
@@ -42,9 +144,39 @@ class Match(enum.Enum):
         return self.name[:3].title()
 
 
+@enum.unique
+class Order(enum.Enum):
+    NAME = 0
+    SIZE = 1
+    SECTION = 2
+    RELEVANCE = 3
+
+
+@enum.unique
+class Installed(enum.Enum):
+    ANY = 0 # Unconstrained
+    INSTALLED = 1 # Including upgradable ones
+    NOT_INSTALLED = 2
+    UPGRADABLE = 3 # Installed, and a higher version is available
+
+
+@enum.unique
+class Relation(enum.Flag):
+    DEPENDS = 1
+    PRE_DEPENDS = 2
+    RECOMMENDS = 4
+    SUGGESTS = 8
+
+
+# The relations apt follows when installing a package (by default)
+DEFAULT_RELATIONS = Relation.DEPENDS | Relation.PRE_DEPENDS | \
+    Relation.RECOMMENDS
+
+
 class _Deb:
 
-    def __init__(self):
+    def __init__(self, arch=ALL_ARCH):
+        self.defaultArch = arch # For Packages files without Architecture
         self.clear()
 
 
@@ -60,6 +192,8 @@ class _Deb:
         self.desc = ''
         self.url = ''
         self.size = 0
+        self.arch = self.defaultArch
+        self.relations = [''] * len(_RELATION_FIELDS)
 
 
     def update(self, key, value):
@@ -81,6 +215,12 @@ class _Deb:
         if key == 'Installed-Size':
             self.size = int(value)
             return False
+        if key == 'Architecture':
+            self.arch = value
+            return False
+        i = _RELATION_INDEX.get(key)
+        if i is not None:
+            self.relations[i] = value
         return False
 
 
@@ -90,12 +230,62 @@ class _Deb:
                    self.url, self.size)
 
 
+    @property
+    def variant(self):
+        '''Returns a (Deb, arch, relations) 3-tuple'''
+        return self.totuple, self.arch, tuple(self.relations)
+
+
+class _StatusDeb(_Deb):
+    '''A dpkg status file's stanza: only valid if it is installed'''
+
+    def clear(self):
+        super().clear()
+        self.installed = False
+
+
+    @property
+    def valid(self):
+        return bool(self.name) and self.installed
+
+
+    def update(self, key, value):
+        if key == 'Status': # e.g., install ok installed
+            self.installed = value.endswith(' installed')
+        elif key == 'Package' or key == 'Version' or key == 'Architecture':
+            super().update(key, value)
+        return False # Descriptions etc. aren't needed
+
+
+# The types of the Query.todict fields that aren't enum names
+_QUERY_FIELD_TYPES = dict(
+    section=str, descWords=str, nameWords=str, includeLibs=bool,
+    includeDocs=bool, minSize=(int, type(None)), maxSize=(int, type(None)),
+    arch=str, dependsOn=str, requiredBy=str, relations=list,
+    transitive=bool)
+
+
 class Query:
 
     def __init__(self, *, section='', descWords='',
                  descMatch=Match.ALL_WORDS, nameWords='',
                  nameMatch=Match.ALL_WORDS, includeLibs=False,
-                 includeDocs=False):
+                 includeDocs=False, minSize=None, maxSize=None, arch='',
+                 installed=Installed.ANY, dependsOn='', requiredBy='',
+                 relations=DEFAULT_RELATIONS, transitive=False):
+        '''minSize and maxSize are inclusive Installed-Size limits (in
+        KiB, as in the Packages files); None means unconstrained. arch is
+        a Debian architecture (e.g., arm64): if given only packages
+        available for it (including arch all packages) match. installed
+        restricts matches by their installed state (see Installed).
+        dependsOn is a package name: if given only the packages that
+        depend on it match; requiredBy is a package name: if given only
+        the packages it depends on match. Either way only the given
+        relations count, and if transitive is True so do indirect ones
+        (e.g., what would pull in dependsOn). Depending on a virtual
+        package is depending on every package that Provides it, and
+        dependsOn or requiredBy may name a virtual package, standing for
+        those packages.'''
         self.section = _genericSection(section)
         self.descWords = descWords
         self.descMatch = descMatch
@@ -103,6 +293,14 @@ class Query:
         self.nameMatch = nameMatch
         self.includeLibs = includeLibs
         self.includeDocs = includeDocs
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.arch = arch
+        self.installed = installed
+        self.dependsOn = dependsOn
+        self.requiredBy = requiredBy
+        self.relations = relations
+        self.transitive = transitive
 
 
     def clear(self):
@@ -113,314 +311,484 @@ class Query:
         self.nameMatch = Match.ALL_WORDS
         self.includeLibs = False
         self.includeDocs = False
+        self.minSize = None
+        self.maxSize = None
+        self.arch = ''
+        self.installed = Installed.ANY
+        self.dependsOn = ''
+        self.requiredBy = ''
+        self.relations = DEFAULT_RELATIONS
+        self.transitive = False
+
+
+    @property
+    def todict(self):
+        '''Returns the query as a JSON-compatible dict'''
+        return dict(section=self.section, descWords=self.descWords,
+                    descMatch=self.descMatch.name, nameWords=self.nameWords,
+                    nameMatch=self.nameMatch.name,
+                    includeLibs=self.includeLibs,
+                    includeDocs=self.includeDocs, minSize=self.minSize,
+                    maxSize=self.maxSize, arch=self.arch,
+                    installed=self.installed.name, dependsOn=self.dependsOn,
+                    requiredBy=self.requiredBy,
+                    relations=[relation.name for relation in Relation
+                               if relation in self.relations],
+                    transitive=self.transitive)
+
+
+    @classmethod
+    def fromdict(cls, data):
+        '''Returns a Query for a dict like those returned by todict;
+        raises KeyError, TypeError, or ValueError if the dict is invalid
+        (e.g., has a field of the wrong type)'''
+        data = dict(data)
+        for key, kind in _QUERY_FIELD_TYPES.items():
+            if key in data and not isinstance(data[key], kind):
+                raise ValueError(f'invalid {key}: {data[key]!r}')
+        for key in ('descMatch', 'nameMatch'):
+            if key in data:
+                data[key] = Match[data[key]]
+        if 'installed' in data:
+            data['installed'] = Installed[data['installed']]
+        if 'relations' in data:
+            data['relations'] = functools.reduce(
+                operator.or_, (Relation[name] for name in data['relations']),
+                Relation(0))
+        return cls(**data)
+
+
+    @property
+    def key(self):
+        descStems, descMatch = _canonicalWords(self.descWords,
+                                               self.descMatch)
+        nameStems, nameMatch = _canonicalWords(self.nameWords,
+                                               self.nameMatch)
+        minSize = self.minSize or None # 0 is unconstrained too
+        return _QueryKey(_genericSection(self.section), descStems,
+                         descMatch, nameStems, nameMatch,
+                         bool(self.includeLibs), bool(self.includeDocs),
+                         minSize, self.maxSize,
+                         (self.arch or '').strip().lower(), self.installed,
+                         (self.dependsOn or '').strip().lower(),
+                         (self.requiredBy or '').strip().lower(),
+                         Relation(self.relations), bool(self.transitive))
 
 
     def __str__(self):
         lib = ' Lib' if self.includeLibs else ''
         doc = ' Doc' if self.includeDocs else ''
+        size = ''
+        if self.minSize or self.maxSize is not None:
+            size = (f' size={self.minSize or 0}-'
+                    f'{"" if self.maxSize is None else self.maxSize}')
+        arch = f' arch={self.arch}' if self.arch else ''
+        installed = ('' if self.installed is Installed.ANY else
+                     f' {self.installed.name.lower()}')
+        dependencies = ''
+        if self.dependsOn or self.requiredBy:
+            relations = '|'.join(relation.name.lower() for relation in
+                                 Relation if relation in self.relations)
+            dependencies = (
+                f' dependsOn={self.dependsOn} requiredBy={self.requiredBy}'
+                f' {relations}{" transitive" if self.transitive else ""}')
         return (f'section={self.section} '
                 f'desc={self.descWords!r}{self.descMatch} '
-                f'name={self.nameWords!r}{self.nameMatch}{lib}{doc}')
+                f'name={self.nameWords!r}{self.nameMatch}{lib}{doc}{size}'
+                f'{arch}{installed}{dependencies}')
 
 
 class Model:
-
-    def __init__(self, onReady):
-        self.load(onReady)
-
-
-    def _clear(self):
-        self._debForName = {} # key = name, value = Deb
-        # namesFor*: key = stemmed word, value = set of names
-        self._namesForStemmedDesc = {}
-        self._namesForStemmedName = {}
-        self._namesForSection = {}
-        self.timer = time.monotonic()
+    '''A Model may be queried by any number of threads while another
+    thread (re)loads it: each load builds a new immutable _Index which
+    is then published by reference, and every query works on whichever
+    _Index was current when it started.
+    '''
+
+    def __init__(self, onReady, *, refresh=False, onEvent=None,
+                 staged=False, onNamesReady=None):
+        self._index = _Index()
+        self._loadLock = threading.Lock() # One writer at a time
+        self._publishLock = threading.Lock()
+        self._statusLock = threading.Lock() # One dpkg status reader
+        # The last dpkg status read: (_statusKey(), installed versionForName)
+        self._status = None
+        self._descsIndexed = threading.Event() # Clear while Stage.NAMES
+        self._descsIndexed.set()
+        self._loadError = None # Why a staged load failed, if it did
+        self._queryStats = None # Only gathered if enabled
+        self.load(onReady, refresh=refresh, onEvent=onEvent, staged=staged,
+                  onNamesReady=onNamesReady)
 
 
     def __len__(self):
-        return len(self._debForName)
+        return len(self._index)
 
 
-    def load(self, onReady, *, refresh=False):
+    def load(self, onReady, *, refresh=False, onEvent=None,
+             staged=False, onNamesReady=None):
         '''onReady is a callback: onReady(message: str,  done: bool)
         To refresh call model.load(onReady, refresh=True)
+        onEvent is an optional callback: onEvent(event: PhaseEvent), e.g.,
+        an EventLog.
+        If staged is True the load is done by a background thread and this
+        returns at once; the callbacks are then called by the background
+        thread. onNamesReady is an optional callback: onNamesReady() is
+        called as soon as names and sections can be searched: if the
+        packages must be read and indexed, that is before the
+        descriptions are indexed (stage is Stage.NAMES, and queries that
+        need the descriptions wait for them). It is called even if the
+        load fails, after onReady(message, True) reports the failure.
         '''
-        self._clear()
-        loaded = False
-        if not refresh:
-            loaded = self._loadFromCache(onReady)
-        if not loaded:
-            self._readPackages(onReady)
-            self._indexPackages(onReady)
-            self._saveToCache()
+        if not staged:
+            self._loadIndex(onReady, refresh, onEvent)
+            return
+        threading.Thread(target=self._loadStaged, args=(
+            onReady, refresh, onEvent, _once(onNamesReady)),
+                         daemon=True).start()
+
+
+    def _loadStaged(self, onReady, refresh, onEvent, namesReady):
+        try:
+            self._loadIndex(onReady, refresh, onEvent, namesReady)
+        except Exception as err: # There's no caller to raise it to
+            self._loadError = err
+            print(f'Failed to load: {err}')
+            onReady(f'Failed to load: {err}', True)
+        finally:
+            # Queries waiting for the descriptions give up (see _indexFor())
+            self._descsIndexed.set()
+            namesReady()
+
+
+    def _loadIndex(self, onReady, refresh, onEvent, namesReady=None):
+        profiling = contextlib.nullcontext()
+        if PROFILE_DIR:
+            import Profiler
+            profiling = Profiler.profile(PROFILE_DIR, 'load')
+        with self._loadLock, profiling as profile:
+            self.timer = time.monotonic()
+            events = _Events(onEvent, self.timer, profile)
+            index = None
+            if not refresh:
+                index = self._loadFromSystemIndex(onReady, events)
+                if index is None:
+                    index = self._loadFromCache(onReady, events)
+            if index is None:
+                index = self._build(onReady, events, namesReady)
+                message = (f'Read and indexed {len(index):,d} packages '
+                           'in')
+            else:
+                message = f'Read {len(index):,d} packages and indexes in'
+            self._publish(index)
+            events('ready', self.timer, items=len(index))
+        self._loadError = None
+        if namesReady is not None:
+            namesReady()
+        onReady(f'{message} {time.monotonic() - self.timer:0.1f}sec.', True)
+
+
+    @property
+    def stage(self):
+        return self._index.stage
 
 
     @property
     def allSections(self):
-        return self._namesForSection.keys()
+        return self._index.allSections
 
 
     @property
     def allNames(self):
-        return self._debForName.keys()
+        return self._index.allNames
+
+
+    @property
+    def allArchs(self):
+        return self._index.allArchs
+
+
+    def archsForName(self, name):
+        return self._index.archsForName(name)
+
+
+    def versionsForName(self, name):
+        return self._index.versionsForName(name)
 
 
     def descForName(self, name):
-        deb = self._debForName.get(name)
-        if deb is None:
-            return ''
-        return deb.desc
+        return self._index.descForName(name)
 
 
     def debForName(self, name):
-        return self._debForName.get(name)
+        return self._index.debForName(name)
 
 
-    def query(self, query):
-        haveSection = set()
-        haveDesc = set()
-        haveName = set()
-        constrainToSection = False
-        constrainToDesc = False
-        constrainToName = False
-        if bool(query.section):
-            constrainToSection = True
-            haveSection = self._namesForSection.get(query.section)
-        if bool(query.descWords):
-            constrainToDesc = True
-            words = _stemmedWords(query.descWords)
-            for word in words:
-                names = self._namesForStemmedDesc.get(word)
-                if names is not None:
-                    haveDesc |= set(names)
-            # haveDesc is names matching Any word
-            # Only accept matching All (doesn't apply if only one word)
-            if len(words) > 1 and query.descMatch is Match.ALL_WORDS:
-                for word in words:
-                    names = self._namesForStemmedDesc.get(word)
-                    if names is not None:
-                        haveDesc &= set(names)
-        if bool(query.nameWords):
-            constrainToName = True
-            words = _stemmedWords(query.nameWords)
-            for word in words:
-                names = self._namesForStemmedName.get(word)
-                if names is not None:
-                    haveName |= set(names)
-            # haveName is names matching Any word
-            # Only accept matching All (doesn't apply if only one word)
-            if len(words) > 1 and query.nameMatch is Match.ALL_WORDS:
-                for word in words:
-                    names = self._namesForStemmedName.get(word)
-                    if names is not None:
-                        haveName &= set(names)
-        names = set(self.allNames)
-        if constrainToSection:
-            names &= haveSection
-        if constrainToDesc:
-            names &= haveDesc
-        if constrainToName:
-            names &= haveName
-        if query.includeLibs and query.includeDocs:
-            return names
-        filteredNames = set()
-        for name in names:
-            if (not query.includeLibs and
-                    (not name.startswith('libre') and
-                        (name.startswith('lib') or '-lib' in name))):
-                continue
-            if not query.includeDocs and name.endswith(('-doc', '-docs')):
-                continue
-            filteredNames.add(name)
-        return filteredNames
-
-
-    def _readPackages(self, onReady):
-        wrongCpu = 'i386' if sys.maxsize > 2 ** 32 else 'amd64'
-        packageFilenames = []
-        descFilenames = []
-        for name in glob.iglob(f'{DATA_DIR}/*'):
-            if wrongCpu not in name and fnmatch.fnmatch(name,
-                                                        PACKAGE_PATTERN):
-                packageFilenames.append(name)
-            elif fnmatch.fnmatch(name, DESC_PATTERN):
-                descFilenames.append(name)
-        onReady('Reading Packages files…', False)
-        descForName = {}
-        allDebs = []
-        try:
-            with concurrent.futures.ProcessPoolExecutor() as executor:
-                futures = set()
-                for filename in packageFilenames:
-                    futures.add(executor.submit(self._readPackageFile,
-                                filename))
-                for filename in descFilenames:
-                    futures.add(executor.submit(self._readDescFile,
-                                filename))
-                for future in concurrent.futures.as_completed(futures):
-                    kind, data = future.result()
-                    if kind is FutureKind.DEBS:
-                        allDebs += data
-                    elif kind is FutureKind.DESCS:
-                        descForName.update(data)
-            seen = set()
-            for deb in allDebs:
-                if deb.name in seen:
-                    continue # Some debs appear in > 1 Packages files
-                seen.add(deb.name)
-                desc = descForName.get(deb.name)
-                if desc is not None:
-                    deb = deb._replace(desc=desc)
-                self._debForName[deb.name] = deb
-            onReady(f'Read {len(self._debForName):,d} packages from '
-                    f'{len(packageFilenames):,d} Packages files in '
-                    f'{time.monotonic() - self.timer:0.1f}sec…', False)
-        except OSError as err:
-            print(err)
-
-
-    def _readPackageFile(self, filename):
-        try:
-            state = _State()
-            debs = []
-            deb = _Deb()
-            with open(filename, 'rt', encoding='utf-8') as file:
-                for lino, line in enumerate(file, 1):
-                    self._readPackageLine(filename, lino, line, debs, deb,
-                                          state)
-            if deb.valid:
-                debs.append(deb.totuple)
-        except OSError as err:
-            print(err)
-        return (FutureKind.DEBS, debs)
-
-
-    def _readPackageLine(self, filename, lino, line, debs, deb, state):
-        if not line.strip():
-            if deb.valid:
-                debs.append(deb.totuple)
-            deb.clear()
-            return
-        if state.inDescription or state.inContinuation:
-            if line.startswith((' ', '\t')):
-                if state.inDescription:
-                    deb.desc += line
-                return
-            state.inDescription = state.inContinuation = False
-        key, value, ok = _maybeKeyValue(line)
-        if not ok:
-            state.inContinuation = True
-        else:
-            state.inDescription = deb.update(key, value)
+    def installedVersion(self, name):
+        '''Returns the installed version of the named package or ''
+        '''
+        return self._withInstalled(self._index).installedVersion(name)
 
 
-    def _readDescFile(self, filename):
-        descRx = re.compile(r'Description(:?-\w+)?:\s+')
-        inList = False
-        nameForDesc = {}
-        name = None
-        desc = []
-        try:
-            with open(filename, 'rt', encoding='utf-8') as file:
-                for line in file:
-                    if name is None:
-                        if line.startswith('Package:'):
-                            if name is not None:
-                                if inList:
-                                    inList = False
-                                    desc.append('\v-')
-                                nameForDesc[name] = ' '.join(desc).strip()
-                                desc.clear()
-                            name = line[8:].strip()
-                    elif line.startswith('Description-md5'):
-                        continue
-                    else: # start of desc or in desc or end of desc
-                        match = descRx.match(line)
-                        if match is not None:
-                            desc = [line[match.end():].strip(), '\n']
-                        else:
-                            line = line.rstrip()
-                            if not line:
-                                nameForDesc[name] = ' '.join(desc).strip()
-                                name = None
-                                desc.clear()
-                            if line == ' .':
-                                if inList:
-                                    inList = False
-                                    desc.append('\v-')
-                                desc.append('\n')
-                            elif line.lstrip().startswith(('* ', '- ')):
-                                if not inList:
-                                    desc.append('\v+')
-                                    inList = True
-                                desc.append(f'\t{line.lstrip()[2:]}')
-                            else:
-                                if inList:
-                                    inList = False
-                                    desc.append('\v-')
-                                desc.append(line)
-            if name is not None:
-                if inList:
-                    inList = False
-                    desc.append('\v-')
-                nameForDesc[name] = ''.join(desc).strip()
-        except OSError as err:
-            print(err)
-        return (FutureKind.DESCS, nameForDesc)
-
-
-    def _indexPackages(self, onReady):
-        size = len(self._debForName)
-        onReady(f'Indexing {size:,d} packages…', False)
-        for name, deb in self._debForName.items():
-            for word in _stemmedWords(name):
-                self._namesForStemmedName.setdefault(word, set()).add(name)
-                self._namesForStemmedDesc.setdefault(word, set()).add(name)
-            for word in _stemmedWords(deb.desc):
-                self._namesForStemmedDesc.setdefault(word, set()).add(name)
-            self._namesForSection.setdefault(deb.section, set()).add(name)
-        onReady(f'Read and indexed {size:,d} packages in '
-                f'{time.monotonic() - self.timer:0.1f}sec.', True)
+    def installedStates(self, names):
+        '''Returns a list of the Installed state (INSTALLED, UPGRADABLE,
+        or NOT_INSTALLED) of each of the named packages'''
+        index = self._withInstalled(self._index)
+        return [index.installedState(name) for name in names]
+
+
+    @property
+    def cacheInfo(self):
+        '''Returns the query cache's statistics as a CacheInfo'''
+        return self._index.cacheInfo
+
+
+    @property
+    def memoryReport(self):
+        '''Returns a JSON-compatible dict of the memory used by the index
+        (see _Index.memoryReport)'''
+        return self._index.memoryReport
+
+
+    def enableQueryStats(self, *, slowSeconds=SLOW_QUERY_SECONDS):
+        '''Starts (or restarts) timing the stages of every query and
+        logging those that take at least slowSeconds (see queryStats)'''
+        self._queryStats = _QueryStats(slowSeconds)
+
+
+    def disableQueryStats(self):
+        self._queryStats = None
+
+
+    @property
+    def queryStats(self):
+        '''Returns None if query stats aren't enabled, or a
+        JSON-compatible dict of the number of queries, the stages' total
+        times and histograms, and the slow query log (each entry with
+        its plan: the steps taken and the number of IDs after each)'''
+        stats = self._queryStats
+        return None if stats is None else stats.todict
+
+
+    def _trace(self, query, op):
+        stats = self._queryStats
+        return None if stats is None else _QueryTrace(stats, query, op)
+
+
+    def query(self, query, *, sectionCounts=False):
+        '''Returns the set of names matching the query, or if
+        sectionCounts is True, a (names, countForSection) 2-tuple (see
+        sectionCounts()).
+        '''
+        return self._indexFor(query).query(
+            query, sectionCounts=sectionCounts,
+            trace=self._trace(query, 'query'))
+
+
+    def count(self, query):
+        '''Returns how many names match the query'''
+        return self._indexFor(query).count(
+            query, trace=self._trace(query, 'count'))
+
+
+    def sectionCounts(self, query):
+        '''Returns a countForSection dict whose keys are the sections
+        holding any of the hits for the query _ignoring_ its section, and
+        whose values are the number of hits in each of those sections.
+        '''
+        return self._indexFor(query).sectionCounts(
+            query, trace=self._trace(query, 'sectionCounts'))
+
+
+    def iterQuery(self, query, *, order=Order.NAME, reverse=False,
+                  limit=None, offset=0):
+        '''Yields the names matching the query in the given order,
+        skipping the first offset names and stopping after limit names
+        (or at the end if limit is None).
+
+        Names are produced using precomputed rank orderings rather than
+        by comparing names or Debs: large match sets are streamed by
+        walking the ordering, so the first page is produced without
+        visiting every match, and small ones are sorted by integer rank.
+        (Order.RELEVANCE must score every match, and reverse is ignored
+        for it.)
+        '''
+        return self._indexFor(query).iterQuery(
+            query, order=order, reverse=reverse, limit=limit,
+            offset=offset, trace=self._trace(query, 'iterQuery'))
+
+
+    def queryMany(self, queries, *, workers=1):
+        '''Returns a list of sets of names, one for each query.
+
+        All the queries share one (unbounded) cache for the batch, so each
+        distinct query, term combination, size range, and section and
+        lib/doc filter is evaluated only once. If workers > 1 the
+        distinct queries are evaluated by that many threads.
+        '''
+        queries = list(queries) # May be an iterator
+        return self._indexFor(*queries).queryMany(queries, workers=workers)
+
+
+    def _indexFor(self, *queries):
+        '''Returns the current index, first waiting for the descriptions
+        to be indexed if any of the queries needs them, and updating its
+        installed state if any of them needs that'''
+        index = self._index
+        # The queries' fields are checked rather than their keys, which
+        # are only made (by stemming, etc.) when they're evaluated
+        if index.stage is Stage.NAMES and any(
+                query.descWords for query in queries):
+            self._descsIndexed.wait()
+            index = self._index
+            if index.stage is Stage.NAMES: # Indexing them failed
+                raise RuntimeError('the descriptions could not be indexed: '
+                                   f'{self._loadError}')
+        if any(query.installed is not Installed.ANY for query in queries):
+            index = self._withInstalled(index)
+        return index
+
+
+    def _withInstalled(self, index):
+        '''Returns index if its installed state is that of the dpkg
+        status file as it is now, or else a copy of index with the
+        current installed state (which is published unless another index
+        has been meanwhile). The file is only reread if it has changed
+        since it was last read, e.g., not for a newly loaded index.'''
+        key = _statusKey()
+        if index.installedKey == key:
+            return index
+        with self._statusLock:
+            if self._status is None or self._status[0] != key:
+                self._status = key, ({} if key is None else
+                                     _readStatusFile(DPKG_STATUS_FILENAME))
+            installedIndex = index.withInstalled(*self._status)
+        self._publish(installedIndex, replacing=index)
+        return installedIndex
+
+
+    def _publish(self, index, *, replacing=None):
+        '''Atomically publishes the new snapshot; if replacing is given,
+        only if it is still the current one'''
+        with self._publishLock:
+            if replacing is not None and self._index is not replacing:
+                return
+            old = self._index
+            if index.stage is Stage.NAMES:
+                self._descsIndexed.clear()
+                self._index = index
+            else:
+                self._index = index
+                self._descsIndexed.set()
+        # New queries use the new snapshot (with its own cache), so free
+        # the old one's cached results now rather than when the last
+        # query still using it has finished
+        old._queryCache.clear()
 
 
     @staticmethod
     def _cacheFilename():
-        return (f'{tempfile.gettempdir()}/'
+        return (f'{CACHE_DIR or tempfile.gettempdir()}/'
                 f'debfind-{datetime.date.today()}.cache')
 
 
-    def _loadFromCache(self, onReady):
+    def _build(self, onReady, events, namesReady=None):
+        '''If namesReady isn't None, the index is published and
+        namesReady() is called before the descriptions are indexed'''
+        if LOW_MEMORY:
+            index = self._buildInChild(onReady, events)
+            if index is not None:
+                return index
+        packages = _readPackages(onReady, self.timer, events)
+        if namesReady is None:
+            index = _Index(packages, onReady, events)
+        else:
+            index = _Index(packages, onReady, events, stage=Stage.NAMES)
+            self._publish(index)
+            events('namesReady', self.timer, items=len(index))
+            onReady(f'Read {len(index):,d} packages in '
+                    f'{time.monotonic() - self.timer:0.1f}sec; indexing '
+                    'descriptions…', False)
+            namesReady()
+            index = index.withDescs(events)
+        if self._saveToCache(index, events):
+            # Share the mapped copy rather than keep a private one
+            index = self._readCache(events) or index
+        return index
+
+
+    def _buildInChild(self, onReady, events):
+        '''Returns the mapped copy of a cache built and saved by a child
+        process (so the memory used to build it is given back to the
+        system when the child exits), or None'''
+        import concurrent.futures
+        onReady('Reading and indexing packages…', False)
+        try:
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=1, mp_context=_mpContext()) as executor:
+                log = executor.submit(_buildCache, DATA_DIR,
+                                      self._cacheFilename(),
+                                      self.timer).result()
+        except (TypeError, ValueError, OSError,
+                concurrent.futures.process.BrokenProcessPool) as err:
+            print(f'Failed to build the index in a child process: {err}')
+            return None
+        for event in log:
+            events.forward(event)
+        return self._readCache(events)
+
+
+    def _loadFromSystemIndex(self, onReady, events):
+        filename = SYSTEM_INDEX_FILENAME
+        if not _isFresh(filename):
+            return None
+        onReady('Reading system index…', False)
+        try:
+            start = time.monotonic()
+            index = _Index.read(filename)
+            events('loadSystemIndex', start, items=len(index),
+                   size=os.path.getsize(filename))
+            return index
+        except (KeyError, ValueError, OSError) as err:
+            print(f'Failed to read system index: {err}')
+        return None
+
+
+    def _loadFromCache(self, onReady, events):
+        if not os.path.exists(self._cacheFilename()):
+            return None
+        onReady('Reading cache…', False)
+        return self._readCache(events)
+
+
+    def _readCache(self, events):
+        '''Returns an _Index that uses the cache file mapped into memory
+        (and so shared with every other process using it), or None'''
         filename = self._cacheFilename()
-        if not os.path.exists(filename):
-            return False
-        onReady(f'Reading cache…', False)
         try:
-            with open(filename, 'rb') as file:
-                data = pickle.load(file)
-            self._debForName = data['debs']
-            self._namesForStemmedDesc = data['descs']
-            self._namesForStemmedName = data['names']
-            self._namesForSection = data['sects']
-            onReady(f'Read {len(self._debForName):,d} packages and indexes '
-                    f'in {time.monotonic() - self.timer:0.1f}sec.', True)
-            return True
-        except (KeyError, pickle.PickleError, OSError) as err:
-            print(f'Failed to write cache: {err}')
+            start = time.monotonic()
+            index = _Index.read(filename)
+            events('loadCache', start, items=len(index),
+                   size=os.path.getsize(filename))
+            return index
+        except (KeyError, ValueError, OSError) as err:
+            print(f'Failed to read cache: {err}')
             self._deleteCache()
-        return False
+        return None
 
 
-    def _saveToCache(self):
-        data = dict(debs=self._debForName, descs=self._namesForStemmedDesc,
-                    names=self._namesForStemmedName,
-                    sects=self._namesForSection)
+    def _saveToCache(self, index, events):
+        '''Returns True if the cache was (atomically) replaced'''
+        filename = self._cacheFilename()
         try:
-            with open(self._cacheFilename(), 'wb') as file:
-                pickle.dump(data, file, 4)
-        except (TypeError, OSError) as err:
+            start = time.monotonic()
+            IndexFile.write(filename, index.todict, CACHE_VERSION)
+            events('saveCache', start, items=len(index),
+                   size=os.path.getsize(filename))
+            return True
+        except (TypeError, ValueError, OSError) as err:
             print(f'Failed to write cache: {err}')
-            self._deleteCache()
+        return False
 
 
     def _deleteCache(self):
@@ -428,6 +796,1428 @@ class Model:
             os.remove(self._cacheFilename())
 
 
+def _once(callback):
+    '''Returns a function that calls callback (if it isn't None) the first
+    time it is called and does nothing after that'''
+    called = threading.Event()
+
+    def call():
+        if callback is not None and not called.is_set():
+            called.set()
+            callback()
+    return call
+
+
+def buildIndex(onReady, filename=SYSTEM_INDEX_FILENAME):
+    '''Reads and indexes the Packages files and atomically replaces
+    filename with the (world-readable) index; raises OSError or
+    ValueError on failure'''
+    timer = time.monotonic()
+    events = _Events(None, timer)
+    index = _Index(_readPackages(onReady, timer, events), onReady, events)
+    os.makedirs(os.path.dirname(filename), mode=0o755, exist_ok=True)
+    IndexFile.write(filename, index.todict, CACHE_VERSION)
+    onReady(f'Wrote the index of {len(index):,d} packages to {filename} '
+            f'in {time.monotonic() - timer:0.1f}sec.', True)
+
+
+class _Index:
+    '''An _Index is never changed once it is built or read, so any
+    number of threads can query it concurrently (its query cache has its
+    own lock).'''
+
+    def __init__(self, packages=None, onReady=None, events=None, *,
+                 stage=Stage.ALL):
+        '''Indexes packages (a _Packages) if given: if stage is
+        Stage.NAMES the descriptions aren't indexed (see withDescs())'''
+        self.stage = stage
+        self._debForName = {} # key = name, value = Deb
+        self._names = [] # key = ID (index), value = name in sorted order
+        # idsFor*: key = stemmed word or section, value = Postings of IDs
+        self._idsForStemmedDesc = {}
+        self._idsForStemmedName = {}
+        self._idsForSection = {}
+        # key = architecture, value = Postings of IDs available for it
+        # (each package's Deb, name, and description are shared by all
+        # its architectures' variants)
+        self._idsForArch = {}
+        self._suites = [] # Sorted suite names, e.g., bookworm-updates
+        self._suiteIds = array.array('H') # key = ID, value = suite index
+        # Sorted names with > 1 version and for each the
+        # versionsForName() list as lines of "version suite"
+        self._versionNames = []
+        self._versionLists = []
+        self._libIds = Postings()
+        self._docIds = Postings()
+        # Each ID's edges to the IDs it depends on (etc.) and the reverse
+        self._depends = _Graph(array.array('I', [0]), array.array('I'),
+                               array.array('B'))
+        self._rdepends = self._depends
+        # Sorted virtual package names (those that are only Provided) and
+        # the IDs that provide each, i.e., those of the virtual package
+        # at i are providerIds[providerOffsets[i]:providerOffsets[i + 1]]
+        self._providedNames = []
+        self._providerOffsets = array.array('I', [0])
+        self._providerIds = array.array('I')
+        # The installed state (see withInstalled()), which isn't saved
+        # since it changes whenever packages are installed or removed
+        self.installedKey = None # The dpkg status file's _statusKey()
+        self._installedVersionForName = {}
+        self._installedIds = Postings()
+        self._upgradableIds = Postings() # Installed < candidate version
+        # Rank permutations: *Rank: key = ID, value = rank (a package's
+        # position in the given order, ties in name order); idsBy*: key =
+        # rank, value = ID. The name rank of an ID is the ID itself.
+        self._sizeRank = array.array('I')
+        self._idsBySize = array.array('I')
+        self._sizeBySize = array.array('I') # key = size rank, value = size
+        self._sectionRank = array.array('I')
+        self._idsBySection = array.array('I')
+        # key = _QueryKey or (index, stems, match), value = Postings
+        self._queryCache = (
+            _LruCache(LOW_MEMORY_QUERY_CACHE_SIZE, compress=True)
+            if LOW_MEMORY else _LruCache(QUERY_CACHE_SIZE))
+        if packages is not None:
+            events = events or _Events(None, time.monotonic())
+            self._indexPackages(packages, onReady, events)
+            if stage is Stage.ALL:
+                self._indexDescs(events)
+
+
+    def _indexPackages(self, packages, onReady, events):
+        self._debForName = packages.debForName
+        size = len(self._debForName)
+        onReady(f'Indexing {size:,d} packages…', False)
+        start = time.monotonic()
+        self._names = sorted(self._debForName)
+        stemSeconds = 0.0
+        # idsFor*: key = stemmed word or section, value = list of IDs
+        # in ascending order (since IDs are visited in order)
+        idsForStemmedName = {}
+        idsForSection = {}
+        idsForArch = {}
+        namesForArch = packages.namesForArch.items()
+        libIds = []
+        docIds = []
+        for id, name in enumerate(self._names):
+            deb = self._debForName[name]
+            stemStart = time.monotonic()
+            nameWords = _stemmedWords(name)
+            stemSeconds += time.monotonic() - stemStart
+            for word in nameWords:
+                _addId(idsForStemmedName, word, id)
+            _addId(idsForSection, deb.section, id)
+            for arch, names in namesForArch:
+                if name in names:
+                    _addId(idsForArch, arch, id)
+            if _isLib(name):
+                libIds.append(id)
+            if _isDoc(name):
+                docIds.append(id)
+        events('stem', start, seconds=stemSeconds, items=size)
+        events('index', start, seconds=time.monotonic() - start -
+               stemSeconds, items=size)
+        start = time.monotonic()
+        self._idsForStemmedName = _postingsForKey(idsForStemmedName)
+        self._idsForSection = _postingsForKey(idsForSection)
+        self._idsForArch = _postingsForKey(idsForArch)
+        suiteForName = packages.suiteForName
+        self._suites = sorted(set(suiteForName.values()))
+        idForSuite = {suite: id for id, suite in enumerate(self._suites)}
+        self._suiteIds = array.array('H', (
+            idForSuite[suiteForName[name]] for name in self._names))
+        versionsForName = packages.versionsForName
+        self._versionNames = sorted(versionsForName)
+        self._versionLists = [
+            '\n'.join(f'{version} {suite}' for version, suite in
+                      versionsForName[name])
+            for name in self._versionNames]
+        self._libIds = Postings(libIds)
+        self._docIds = Postings(docIds)
+        events('postings', start, items=len(idsForStemmedName) +
+               len(idsForSection) + len(idsForArch))
+        start = time.monotonic()
+        self._depends, self._rdepends, idsForProvided = _dependencyGraphs(
+            self._names, packages.relationsForName)
+        self._providedNames = sorted(
+            name for name in idsForProvided if _find(self._names, name) == -1)
+        providers = [sorted(set(idsForProvided[name]))
+                     for name in self._providedNames]
+        self._providerOffsets = array.array('I', itertools.accumulate(
+            itertools.chain((0,), map(len, providers))))
+        self._providerIds = array.array(
+            'I', itertools.chain.from_iterable(providers))
+        events('dependencies', start, items=len(self._depends.ids))
+        start = time.monotonic()
+        sizes = [self._debForName[name].size for name in self._names]
+        self._sizeRank, self._idsBySize = _ranks(sizes)
+        self._sizeBySize = array.array('I', (sizes[id]
+                                             for id in self._idsBySize))
+        self._sectionRank, self._idsBySection = _ranks(
+            [self._debForName[name].section for name in self._names])
+        events('rank', start, items=size)
+
+
+    def withDescs(self, events):
+        '''Returns a Stage.ALL copy of this Stage.NAMES _Index (which
+        is left unchanged) with its descriptions indexed'''
+        index = copy.copy(self) # Shares the unchanging parts
+        index._queryCache = _LruCache(self._queryCache.maxsize,
+                                      compress=self._queryCache.compress)
+        index._indexDescs(events)
+        index.stage = Stage.ALL
+        return index
+
+
+    def withInstalled(self, key, installedVersionForName):
+        '''Returns a copy of this _Index (which is left unchanged) with
+        the installed state for the given dpkg status file _statusKey()
+        and installed packages' versions (key = name): the installed and
+        upgradable IDs are then filtered using Postings operations'''
+        index = copy.copy(self) # Shares the unchanging parts
+        index._queryCache = _LruCache(self._queryCache.maxsize,
+                                      compress=self._queryCache.compress)
+        index.installedKey = key
+        index._installedVersionForName = installedVersionForName
+        installedIds = []
+        upgradableIds = []
+        for name, version in installedVersionForName.items():
+            id = _find(self._names, name)
+            if id == -1: # Not in any list, e.g., installed from a .deb
+                continue
+            installedIds.append(id)
+            candidate = self._debForName[name].version
+            if version != candidate and (_versionKey(version) <
+                                         _versionKey(candidate)):
+                upgradableIds.append(id)
+        index._installedIds = Postings(installedIds)
+        index._upgradableIds = Postings(upgradableIds)
+        return index
+
+
+    def _indexDescs(self, events):
+        start = time.monotonic()
+        # key = stemmed word, value = list of IDs in ascending order
+        idsForStemmedDesc = {}
+        for id, name in enumerate(self._names):
+            for word in _stemmedWords(self._debForName[name].desc):
+                _addId(idsForStemmedDesc, word, id)
+        idsForStemmedDesc = _postingsForKey(idsForStemmedDesc)
+        # A name's words are searched as description words too
+        for word, ids in self._idsForStemmedName.items():
+            descIds = idsForStemmedDesc.get(word)
+            idsForStemmedDesc[word] = (ids if descIds is None else
+                                       descIds | ids)
+        self._idsForStemmedDesc = idsForStemmedDesc
+        events('descs', start, items=len(idsForStemmedDesc))
+
+
+    @property
+    def todict(self):
+        '''Returns the index's parts in a form that IndexFile can write:
+        the Debs are stored as columns in ID order'''
+        debs = [self._debForName[name] for name in self._names]
+        return dict(names=self._names,
+                    versions=[deb.version for deb in debs],
+                    sections=[deb.section for deb in debs],
+                    descs=[deb.desc for deb in debs],
+                    urls=[deb.url for deb in debs],
+                    sizes=array.array('I', (deb.size for deb in debs)),
+                    descIndex=self._idsForStemmedDesc,
+                    nameIndex=self._idsForStemmedName,
+                    sectionIndex=self._idsForSection,
+                    archIndex=self._idsForArch, suites=self._suites,
+                    suiteIds=self._suiteIds,
+                    versionNames=self._versionNames,
+                    versionLists=self._versionLists,
+                    depOffsets=self._depends.offsets,
+                    depIds=self._depends.ids, depKinds=self._depends.kinds,
+                    rdepOffsets=self._rdepends.offsets,
+                    rdepIds=self._rdepends.ids,
+                    rdepKinds=self._rdepends.kinds,
+                    providedNames=self._providedNames,
+                    providerOffsets=self._providerOffsets,
+                    providerIds=self._providerIds, libs=self._libIds,
+                    docs=self._docIds, sizeRank=self._sizeRank,
+                    idsBySize=self._idsBySize, sizeBySize=self._sizeBySize,
+                    sectionRank=self._sectionRank,
+                    idsBySection=self._idsBySection)
+
+
+    @classmethod
+    def fromdict(cls, data):
+        '''Returns an _Index for the parts returned by IndexFile.read():
+        the Debs and the word indexes are decoded only as needed'''
+        index = cls()
+        index._debForName = _DebTable(data)
+        index._names = data['names']
+        index._idsForStemmedDesc = data['descIndex']
+        index._idsForStemmedName = data['nameIndex']
+        # There are few sections and sectionCounts() uses them all
+        index._idsForSection = (data['sectionIndex'] if LOW_MEMORY else
+                                dict(data['sectionIndex'].items()))
+        index._idsForArch = dict(data['archIndex'].items()) # Very few
+        index._suites = data['suites']
+        index._suiteIds = data['suiteIds']
+        index._versionNames = data['versionNames']
+        index._versionLists = data['versionLists']
+        index._depends = _Graph(data['depOffsets'], data['depIds'],
+                                data['depKinds'])
+        index._rdepends = _Graph(data['rdepOffsets'], data['rdepIds'],
+                                 data['rdepKinds'])
+        index._providedNames = data['providedNames']
+        index._providerOffsets = data['providerOffsets']
+        index._providerIds = data['providerIds']
+        index._libIds = data['libs']
+        index._docIds = data['docs']
+        index._sizeRank = data['sizeRank']
+        index._idsBySize = data['idsBySize']
+        index._sizeBySize = data['sizeBySize']
+        index._sectionRank = data['sectionRank']
+        index._idsBySection = data['idsBySection']
+        return index
+
+
+    @classmethod
+    def read(cls, filename):
+        '''Returns an _Index for the given index file (see fromdict());
+        in low-memory mode its descriptions are read from disk'''
+        return cls.fromdict(IndexFile.read(
+            filename, CACHE_VERSION,
+            unmapped={'descs'} if LOW_MEMORY else ()))
+
+
+    def __len__(self):
+        return len(self._debForName)
+
+
+    @property
+    def allSections(self):
+        return self._idsForSection.keys()
+
+
+    @property
+    def allNames(self):
+        return self._debForName.keys()
+
+
+    @property
+    def allArchs(self):
+        return self._idsForArch.keys()
+
+
+    def archsForName(self, name):
+        '''Returns the sorted list of the architectures the named package
+        is available for'''
+        id = _find(self._names, name)
+        if id == -1:
+            return []
+        return sorted(arch for arch, ids in self._idsForArch.items()
+                      if id in ids)
+
+
+    def versionsForName(self, name):
+        '''Returns a list of (version, suite) 2-tuples of the named
+        package's available versions: the candidate (whose Deb is shown)
+        first, then the others in descending version order'''
+        i = _find(self._versionNames, name)
+        if i != -1:
+            return [tuple(line.split(' ', 1))
+                    for line in self._versionLists[i].splitlines()]
+        id = _find(self._names, name)
+        if id == -1:
+            return []
+        return [(self._debForName[name].version,
+                 self._suites[self._suiteIds[id]])]
+
+
+    def descForName(self, name):
+        deb = self._debForName.get(name)
+        if deb is None:
+            return ''
+        return deb.desc
+
+
+    def debForName(self, name):
+        return self._debForName.get(name)
+
+
+    def installedVersion(self, name):
+        return self._installedVersionForName.get(name, '')
+
+
+    def installedState(self, name):
+        '''Returns INSTALLED, UPGRADABLE, or NOT_INSTALLED'''
+        if name not in self._installedVersionForName:
+            return Installed.NOT_INSTALLED
+        id = _find(self._names, name)
+        if id != -1 and id in self._upgradableIds:
+            return Installed.UPGRADABLE
+        return Installed.INSTALLED
+
+
+    @property
+    def cacheInfo(self):
+        '''Returns the query cache's statistics as a CacheInfo'''
+        return self._queryCache.info
+
+
+    @property
+    def memoryReport(self):
+        '''Returns a JSON-compatible dict of the approximate bytes used
+        by each of the index's components, by each Deb field, and by the
+        terms of the word indexes bucketed by how many IDs they have (1,
+        2-3, 4-7, etc.). Each size is split into private bytes (the
+        process's own) and mapped bytes (in the shared index file, and
+        only resident once touched).'''
+        debs = self._debForName
+        if isinstance(debs, _DebTable):
+            fields = {field: _memoryUse(getattr(debs, f'_{field}s'))
+                      for field in Deb._fields}
+            records = (0, 0)
+        else:
+            fields = {field: (sum(sys.getsizeof(getattr(deb, field))
+                                  for deb in debs.values()), 0)
+                      for field in Deb._fields if field != 'name'}
+            fields['name'] = _memoryUse(self._names)
+            records = (sys.getsizeof(debs) + sum(
+                sys.getsizeof(deb) for deb in debs.values()), 0)
+        components = dict(
+            debs=_sumUse(records, *fields.values()),
+            descIndex=_memoryUse(self._idsForStemmedDesc),
+            nameIndex=_memoryUse(self._idsForStemmedName),
+            sectionIndex=_memoryUse(self._idsForSection),
+            archIndex=_memoryUse(self._idsForArch),
+            versions=_sumUse(_memoryUse(self._suites),
+                             _memoryUse(self._suiteIds),
+                             _memoryUse(self._versionNames),
+                             _memoryUse(self._versionLists)),
+            dependencies=_sumUse(*(_memoryUse(part) for part in (
+                *self._depends, *self._rdepends, self._providedNames,
+                self._providerOffsets, self._providerIds))),
+            libsAndDocs=_sumUse(_memoryUse(self._libIds),
+                                _memoryUse(self._docIds)),
+            installed=_sumUse(_memoryUse(self._installedIds),
+                              _memoryUse(self._upgradableIds)),
+            ranks=_sumUse(*(_memoryUse(ranks) for ranks in (
+                self._sizeRank, self._idsBySize, self._sizeBySize,
+                self._sectionRank, self._idsBySection))),
+            queryCache=(self._queryCache.nbytes, 0))
+        return dict(
+            packages=len(self), lowMemory=LOW_MEMORY,
+            peakMemory=_peakMemory(),
+            total=_asUse(_sumUse(*components.values())),
+            components={name: _asUse(use)
+                        for name, use in components.items()},
+            fields={name: _asUse(use) for name, use in fields.items()},
+            termBuckets=dict(
+                desc=_termBuckets(self._idsForStemmedDesc),
+                name=_termBuckets(self._idsForStemmedName)))
+
+
+    def query(self, query, *, sectionCounts=False, trace=None):
+        '''Returns the set of names matching the query, or if
+        sectionCounts is True, a (names, countForSection) 2-tuple (see
+        sectionCounts()).
+        '''
+        names = self._names
+        ids = {names[id] for id in self._queryIds(query, trace=trace)}
+        if trace is not None:
+            trace.finish(len(ids))
+        if not sectionCounts:
+            return ids
+        return ids, self.sectionCounts(query)
+
+
+    def count(self, query, *, trace=None):
+        '''Returns how many names match the query'''
+        count = len(self._queryIds(query, trace=trace))
+        if trace is not None:
+            trace.finish(count)
+        return count
+
+
+    def sectionCounts(self, query, *, trace=None):
+        '''Returns a countForSection dict whose keys are the sections
+        holding any of the hits for the query _ignoring_ its section, and
+        whose values are the number of hits in each of those sections.
+        '''
+        ids = self._queryIds(query, ignoreSection=True, trace=trace)
+        countForSection = {}
+        for section, sectionIds in self._idsForSection.items():
+            count = ids.intersectionCount(sectionIds)
+            if count:
+                countForSection[section] = count
+        if trace is not None:
+            trace.finish(len(countForSection))
+        return countForSection
+
+
+    def iterQuery(self, query, *, order=Order.NAME, reverse=False,
+                  limit=None, offset=0, trace=None):
+        '''Yields the names matching the query in the given order,
+        skipping the first offset names and stopping after limit names
+        (or at the end if limit is None).
+
+        Names are produced using precomputed rank orderings rather than
+        by comparing names or Debs: large match sets are streamed by
+        walking the ordering, so the first page is produced without
+        visiting every match, and small ones are sorted by integer rank.
+        (Order.RELEVANCE must score every match, and reverse is ignored
+        for it.)
+        '''
+        matches = self._queryIds(query, trace=trace)
+        if trace is not None: # The names themselves are produced lazily
+            trace.finish(len(matches))
+        if order is Order.RELEVANCE:
+            ids = self._idsByRelevance(query, matches)
+        elif order is Order.NAME: # IDs are in name order
+            ids = reversed(list(matches)) if reverse else iter(matches)
+        else:
+            ids = self._idsInOrder(matches, order, reverse)
+        stop = None if limit is None else offset + limit
+        names = self._names
+        for id in itertools.islice(ids, offset, stop):
+            yield names[id]
+
+
+    def _rankForOrder(self, order):
+        return self._sizeRank if order is Order.SIZE else self._sectionRank
+
+
+    def _idsInOrder(self, matches, order, reverse):
+        if len(matches) * SORT_FRACTION < len(self._names):
+            return iter(sorted(matches, key=self._rankForOrder(order)
+                               .__getitem__, reverse=reverse))
+        idsInOrder = (self._idsBySize if order is Order.SIZE else
+                      self._idsBySection)
+        if reverse:
+            idsInOrder = reversed(idsInOrder)
+        return (id for id in idsInOrder if id in matches)
+
+
+    def _idsByRelevance(self, query, ids):
+        '''Yields IDs in descending order of relevance (name order for
+        ties), where each query word matched in a name scores 2 and each
+        one matched in a description scores 1, using a bucket rather
+        than a comparison sort'''
+        key = query.key
+        weighted = []
+        for stems, idsForStemmedWord, weight in (
+                (key.nameStems, self._idsForStemmedName, 2),
+                (key.descStems, self._idsForStemmedDesc, 1)):
+            for stem in stems or ():
+                stemIds = idsForStemmedWord.get(stem)
+                if stemIds is not None:
+                    weighted.append((stemIds, weight))
+        if not weighted:
+            yield from ids
+            return
+        idsForScore = collections.defaultdict(list)
+        for id in ids:
+            idsForScore[sum(weight for stemIds, weight in weighted
+                            if id in stemIds)].append(id)
+        for score in sorted(idsForScore, reverse=True):
+            yield from idsForScore[score]
+
+
+    def queryMany(self, queries, *, workers=1):
+        '''Returns a list of sets of names, one for each query.
+
+        All the queries share one (unbounded) cache for the batch, so each
+        distinct query, term combination, size range, and section and
+        lib/doc filter is evaluated only once. If workers > 1 the
+        distinct queries are evaluated by that many threads.
+        '''
+        cache = _LruCache(sys.maxsize)
+        keys = [query.key for query in queries]
+        distinctKeys = list(dict.fromkeys(keys))
+        if workers > 1 and len(distinctKeys) > 1:
+            import concurrent.futures
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                idsForKey = dict(zip(distinctKeys, executor.map(
+                    lambda key: self._idsForKey(key, cache),
+                    distinctKeys)))
+        else:
+            idsForKey = {key: self._idsForKey(key, cache)
+                         for key in distinctKeys}
+        names = self._names
+        return [{names[id] for id in idsForKey[key]} for key in keys]
+
+
+    def _queryIds(self, query, *, ignoreSection=False, trace=None):
+        key = query.key
+        if ignoreSection:
+            key = key._replace(section='')
+        if trace is not None:
+            trace.stage('stem')
+        return self._idsForKey(key, self._queryCache, trace)
+
+
+    def _idsForKey(self, key, cache, trace=None):
+        '''Returns the IDs matching the key from the cache or by
+        evaluating them (in which case they are added to the cache).
+        The same cache is used for the key's sub-results. If trace isn't
+        None the time taken by each stage and the plan are recorded in
+        it.'''
+        ids = cache.get(key)
+        if ids is not None:
+            if trace is not None:
+                trace.step('cached', ids)
+            return ids
+        constraints = []
+        if bool(key.section):
+            constraints.append(self._idsForSection.get(key.section,
+                                                       Postings()))
+            if trace is not None:
+                trace.stage('lookup')
+                trace.step(f'section {key.section}', constraints[-1])
+        if key.descStems is not None:
+            constraints.append(self._idsForStems(
+                cache, 'desc', self._idsForStemmedDesc, key.descStems,
+                key.descMatch, trace))
+        if key.nameStems is not None:
+            constraints.append(self._idsForStems(
+                cache, 'name', self._idsForStemmedName, key.nameStems,
+                key.nameMatch, trace))
+        if key.minSize is not None or key.maxSize is not None:
+            constraints.append(self._idsForSizes(cache, key.minSize,
+                                                 key.maxSize, trace))
+        if key.arch:
+            constraints.append(self._idsForArchKey(cache, key.arch, trace))
+        if (key.installed is Installed.INSTALLED or
+                key.installed is Installed.UPGRADABLE):
+            constraints.append(self._installedIds if key.installed is
+                               Installed.INSTALLED else self._upgradableIds)
+            if trace is not None:
+                trace.stage('lookup')
+                trace.step(key.installed.name.lower(), constraints[-1])
+        if key.dependsOn:
+            constraints.append(self._idsForRelations(
+                cache, 'dependsOn', self._rdepends, key.dependsOn,
+                key.relations, key.transitive, trace))
+        if key.requiredBy:
+            constraints.append(self._idsForRelations(
+                cache, 'requiredBy', self._depends, key.requiredBy,
+                key.relations, key.transitive, trace))
+        if constraints:
+            ids = Postings.intersection(constraints)
+            if trace is not None:
+                trace.stage('intersect')
+                trace.step('intersection', ids)
+            if not key.includeLibs:
+                ids -= self._libIds
+            if not key.includeDocs:
+                ids -= self._docIds
+            if trace is not None:
+                trace.stage('filter')
+                trace.step('lib/doc filter', ids)
+        else:
+            ids = self._allIds(cache, key.includeLibs, key.includeDocs,
+                               trace)
+        if key.installed is Installed.NOT_INSTALLED:
+            ids -= self._installedIds
+            if trace is not None:
+                trace.stage('filter')
+                trace.step('not installed filter', ids)
+        cache.put(key, ids)
+        return ids
+
+
+    def _allIds(self, cache, includeLibs, includeDocs, trace=None):
+        key = ('all', includeLibs, includeDocs)
+        ids = cache.get(key)
+        if ids is None:
+            ids = Postings.fromRange(len(self._names))
+            if not includeLibs:
+                ids -= self._libIds
+            if not includeDocs:
+                ids -= self._docIds
+            cache.put(key, ids)
+        if trace is not None:
+            trace.stage('filter')
+            trace.step('all lib/doc filter', ids)
+        return ids
+
+
+    def _idsForSizes(self, cache, minSize, maxSize, trace=None):
+        '''Returns the IDs whose size is in the inclusive range found by
+        bisecting the sizes in size order, so no Deb is visited'''
+        key = ('size', minSize, maxSize)
+        ids = cache.get(key)
+        if ids is None:
+            sizes = self._sizeBySize
+            start = 0 if minSize is None else bisect.bisect_left(sizes,
+                                                                 minSize)
+            end = (len(sizes) if maxSize is None else
+                   bisect.bisect_right(sizes, maxSize))
+            if end - start > len(sizes) // 2: # Cheaper to exclude
+                ids = (Postings.fromRange(len(sizes)) -
+                       Postings(self._idsBySize[:start]) -
+                       Postings(self._idsBySize[end:]))
+            else:
+                ids = Postings(self._idsBySize[start:end])
+            cache.put(key, ids)
+        if trace is not None:
+            trace.stage('lookup')
+            trace.step(f'size {minSize}-{maxSize}', ids)
+        return ids
+
+
+    def _idsForArchKey(self, cache, arch, trace=None):
+        key = ('arch', arch)
+        ids = cache.get(key)
+        if ids is None:
+            ids = Postings.union([self._idsForArch.get(arch, Postings()),
+                                  self._idsForArch.get(ALL_ARCH,
+                                                       Postings())])
+            cache.put(key, ids)
+        if trace is not None:
+            trace.stage('lookup')
+            trace.step(f'arch {arch}', ids)
+        return ids
+
+
+    def _idsForRelations(self, cache, kind, graph, name, relations,
+                         transitive, trace=None):
+        '''Returns the IDs the named package has edges to in the graph
+        (or if transitive, the IDs reachable from it) through edges of
+        any of the given relations; a virtual package's name stands for
+        the packages that provide it'''
+        key = (kind, name, relations, transitive)
+        ids = cache.get(key)
+        if ids is None:
+            found = set()
+            id = _find(self._names, name)
+            if id != -1:
+                starts = [id]
+            else:
+                i = _find(self._providedNames, name)
+                starts = ([] if i == -1 else list(self._providerIds[
+                    self._providerOffsets[i]:self._providerOffsets[i + 1]]))
+            offsets = graph.offsets
+            mask = relations.value
+            pending = starts.copy()
+            while pending:
+                source = pending.pop()
+                start = offsets[source]
+                end = offsets[source + 1]
+                for target, kinds in zip(graph.ids[start:end],
+                                         graph.kinds[start:end]):
+                    if kinds & mask and target not in found:
+                        found.add(target)
+                        if transitive:
+                            pending.append(target)
+            if id != -1:
+                found.discard(id) # Only through a cycle
+            ids = Postings(found)
+            cache.put(key, ids)
+        if trace is not None:
+            trace.stage('lookup')
+            trace.step(f'{kind} {name}', ids)
+        return ids
+
+
+    def _idsForStems(self, cache, index, idsForStemmedWord, stems, match,
+                     trace=None):
+        # The sub-result is cached too so that it is reused by queries
+        # that differ only in their other constraints or their flags
+        key = (index, stems, match)
+        ids = cache.get(key)
+        if ids is None:
+            postings = []
+            for stem in stems:
+                stemIds = idsForStemmedWord.get(stem)
+                # Words that aren't indexed are ignored for All and Any
+                if stemIds is not None:
+                    postings.append(stemIds)
+                if trace is not None:
+                    trace.step(f'{index} {stem}', stemIds)
+            if trace is not None:
+                trace.stage('lookup')
+            if match is Match.ALL_WORDS:
+                ids = Postings.intersection(postings)
+            else:
+                ids = Postings.union(postings)
+            cache.put(key, ids)
+            if trace is not None:
+                trace.stage('intersect')
+        if trace is not None:
+            trace.step(f'{index} {match.name}', ids)
+        return ids
+
+
+class _DebTable(collections.abc.Mapping):
+    '''A read-only name → Deb mapping over the Deb columns of a mapped
+    index file'''
+
+    def __init__(self, data):
+        self._names = data['names']
+        self._versions = data['versions']
+        self._sections = data['sections']
+        self._descs = data['descs']
+        self._urls = data['urls']
+        self._sizes = data['sizes']
+
+
+    def __len__(self):
+        return len(self._names)
+
+
+    def __iter__(self):
+        return iter(self._names)
+
+
+    def __contains__(self, name):
+        return self._names.find(name) != -1
+
+
+    def __getitem__(self, name):
+        id = self._names.find(name)
+        if id == -1:
+            raise KeyError(name)
+        return Deb(name, self._versions[id], self._sections[id],
+                   self._descs[id], self._urls[id], self._sizes[id])
+
+
+class EventLog(list):
+    '''An onEvent callback for load() that keeps the PhaseEvents'''
+
+    def __call__(self, event):
+        self.append(event)
+
+
+    def dump(self, file):
+        '''Writes the events to the open text file as a JSON list'''
+        json.dump([event._asdict() for event in self], file, indent=1)
+        file.write('\n')
+
+
+class _Events:
+    '''Calls onEvent (unless it is None) with a PhaseEvent for a phase
+    that began at start (time.monotonic()) of a load that began at
+    timer; the phase's seconds are from start unless given. If profile
+    (a Profiler.Profile) isn't None, the phase's allocations are marked.
+    '''
+
+    def __init__(self, onEvent, timer, profile=None):
+        self.onEvent = onEvent
+        self.timer = timer
+        self.profile = profile
+
+
+    def forward(self, event):
+        '''Passes on a PhaseEvent from another process'''
+        if self.profile is not None:
+            self.profile.mark(event.phase)
+        if self.onEvent is not None:
+            self.onEvent(event)
+
+
+    def __call__(self, phase, start, *, seconds=None, items=0, size=0):
+        if self.profile is not None:
+            self.profile.mark(phase)
+        if self.onEvent is not None:
+            now = time.monotonic()
+            if seconds is None:
+                seconds = now - start
+            self.onEvent(PhaseEvent(phase, seconds, now - self.timer,
+                                    items, size, _peakMemory()))
+
+
+class _QueryStats:
+
+    def __init__(self, slowSeconds):
+        self.slowSeconds = slowSeconds
+        self.count = 0
+        self.secondsForStage = dict.fromkeys(QUERY_STAGES, 0.0)
+        self.histogramForStage = {stage: [0] * HISTOGRAM_BUCKETS
+                                  for stage in QUERY_STAGES}
+        self.slowQueries = collections.deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self._lock = threading.Lock()
+
+
+    def add(self, trace):
+        with self._lock:
+            self.count += 1
+            for stage, seconds in trace.secondsForStage.items():
+                self.secondsForStage[stage] += seconds
+                bucket = min(int(seconds * 1_000_000).bit_length(),
+                             HISTOGRAM_BUCKETS - 1)
+                self.histogramForStage[stage][bucket] += 1
+            if trace.secondsForStage['total'] >= self.slowSeconds:
+                self.slowQueries.append(trace.todict)
+
+
+    @property
+    def todict(self):
+        with self._lock:
+            return dict(count=self.count, slowSeconds=self.slowSeconds,
+                        secondsForStage=dict(self.secondsForStage),
+                        histogramForStage={
+                            stage: list(histogram) for stage, histogram in
+                            self.histogramForStage.items()},
+                        slowQueries=list(self.slowQueries))
+
+
+class _QueryTrace:
+    '''Records how long one query spends in each stage and its plan: the
+    steps taken and how many IDs each step produced'''
+
+    def __init__(self, stats, query, op):
+        self.stats = stats
+        self.query = query
+        self.op = op
+        self.secondsForStage = dict.fromkeys(QUERY_STAGES, 0.0)
+        self.plan = []
+        self.start = self.mark = time.perf_counter()
+
+
+    def stage(self, stage):
+        '''Adds the time since the last stage ended to this stage's'''
+        now = time.perf_counter()
+        self.secondsForStage[stage] += now - self.mark
+        self.mark = now
+
+
+    def step(self, description, ids):
+        self.plan.append((description, 0 if ids is None else len(ids)))
+
+
+    def finish(self, size):
+        self.stage('result')
+        self.secondsForStage['total'] = self.mark - self.start
+        self.size = size
+        self.stats.add(self)
+
+
+    @property
+    def todict(self):
+        return dict(op=self.op, query=self.query.todict, size=self.size,
+                    secondsForStage=self.secondsForStage,
+                    plan=[list(step) for step in self.plan])
+
+
+class _LruCache:
+
+    def __init__(self, maxsize, *, compress=False):
+        self.maxsize = maxsize
+        self.compress = compress # If True Postings are held zlib'd
+        self._valueForKey = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def clear(self):
+        with self._lock:
+            self._valueForKey.clear()
+
+
+    @property
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize,
+                             len(self._valueForKey))
+
+
+    @property
+    def nbytes(self):
+        '''Returns the approximate number of bytes used'''
+        with self._lock:
+            values = list(self._valueForKey.values())
+        return sys.getsizeof(self._valueForKey) + sum(
+            sys.getsizeof(value) if self.compress else value.nbytes
+            for value in values)
+
+
+    def get(self, key):
+        with self._lock:
+            value = self._valueForKey.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._valueForKey.move_to_end(key)
+        if value is not None and self.compress:
+            value = Postings.frombytes(zlib.decompress(value))
+        return value
+
+
+    def put(self, key, value):
+        if self.compress:
+            value = zlib.compress(value.tobytes(), 1)
+        with self._lock:
+            self._valueForKey[key] = value
+            self._valueForKey.move_to_end(key)
+            if len(self._valueForKey) > self.maxsize:
+                self._valueForKey.popitem(last=False)
+
+
+def _readPackages(onReady, timer, events=None):
+    import concurrent.futures
+    if events is None:
+        events = _Events(None, timer)
+    start = time.monotonic()
+    # key = uncompressed name, value = name (uncompressed if possible)
+    packageFilenameForBase = {}
+    descFilenameForBase = {}
+    for name in glob.iglob(f'{DATA_DIR}/*'):
+        base, suffix = os.path.splitext(name)
+        if suffix not in COMPRESSION_SUFFIXES:
+            base = name
+        if fnmatch.fnmatch(base, PACKAGE_PATTERN):
+            filenameForBase = packageFilenameForBase
+        elif fnmatch.fnmatch(base, DESC_PATTERN):
+            filenameForBase = descFilenameForBase
+        else:
+            continue
+        if name == base or base not in filenameForBase:
+            filenameForBase[base] = name
+    packageFilenames = list(packageFilenameForBase.values())
+    descFilenames = list(descFilenameForBase.values())
+    events('glob', start, items=len(packageFilenames) + len(descFilenames))
+    onReady('Reading Packages files…', False)
+    packages = _Packages({}, {}, {}, {}, {})
+    # key = filename, value = list of variants or descForName dict
+    resultForFilename = {}
+    parsing = _WorkerStats(0.0, 0.0, 0, 0) # Summed over all the workers
+    payloadSize = 0
+    try:
+        start = time.monotonic()
+        context = _mpContext()
+        # The workers add the bytes and stanzas they've read so far
+        progress = context.Array('q', 2)
+        totalSize = sum(os.path.getsize(filename) for filename in
+                        itertools.chain(packageFilenames, descFilenames))
+        # Not fork: other threads may be querying (and holding locks)
+        with concurrent.futures.ProcessPoolExecutor(
+                mp_context=context, initializer=_initWorker,
+                initargs=(progress,)) as executor:
+            futures = {} # key = future, value = filename
+            for filename in packageFilenames:
+                futures[executor.submit(_worker(_readPackageFile),
+                                        filename)] = filename
+            for filename in descFilenames:
+                futures[executor.submit(_worker(_readDescFile),
+                                        filename)] = filename
+            pending = set(futures)
+            reported = start
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, timeout=PROGRESS_SECONDS,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    payload, stats = future.result()
+                    unpickleStart = time.monotonic()
+                    data = pickle.loads(payload)
+                    payloadSize += len(payload)
+                    parsing = _WorkerStats(
+                        parsing.seconds + stats.seconds,
+                        parsing.pickleSeconds + stats.pickleSeconds +
+                        time.monotonic() - unpickleStart,
+                        parsing.bytes + stats.bytes,
+                        parsing.items + stats.items)
+                    resultForFilename[futures[future]] = data
+                now = time.monotonic()
+                if pending and now - reported >= PROGRESS_SECONDS:
+                    reported = now
+                    onReady(_progressMessage(progress, totalSize,
+                                             now - start), False)
+        events('pool', start, items=len(futures))
+        events('parse', start, seconds=parsing.seconds,
+               items=parsing.items, size=parsing.bytes)
+        events('ipc', start, seconds=parsing.pickleSeconds,
+               items=len(futures), size=payloadSize)
+        start = time.monotonic()
+        with _gcPaused():
+            packages = _merge(
+                {filename: resultForFilename.get(filename, [])
+                 for filename in packageFilenames},
+                [resultForFilename.get(filename, {})
+                 for filename in sorted(descFilenames)])
+        events('merge', start, items=len(packages.debForName))
+        onReady(f'Read {len(packages.debForName):,d} packages from '
+                f'{len(packageFilenames):,d} Packages files in '
+                f'{time.monotonic() - timer:0.1f}sec…', False)
+    except OSError as err:
+        print(err)
+    return packages
+
+
+def _merge(debsForFilename, descForNames):
+    '''Returns a _Packages for the lists of (Deb, arch, relations)
+    3-tuples read from each Packages file and the descForName dicts read
+    from the Translation files (later ones taking precedence).
+
+    Packages often appear in several files (for each suite, e.g.,
+    bookworm and bookworm-updates, and each arch). Each name's candidate
+    Deb is the native (or arch all) variant with the highest version (in
+    Debian version order), or if there are none, the foreign one with
+    the highest version; of those, the one from the file whose name
+    sorts last, so the result doesn't depend on the order the files were
+    read in. Other archs' versions are only listed (see
+    versionsForName()). The variants are merged all at
+    once using builtins (zip(), dict(), set(), etc.); only the names
+    with more than one version are visited one by one.
+    '''
+    preferredArchs = {_nativeArch(), ALL_ARCH}
+    # Later Debs replace earlier ones, so preferred archs' files go last
+    filenames = sorted(debsForFilename, key=lambda filename: (
+        _archForFilename(filename) in preferredArchs, filename))
+    variants = list(itertools.chain.from_iterable(
+        debsForFilename[filename] for filename in filenames))
+    if not variants:
+        return _Packages({}, {}, {}, {}, {})
+    # Transposing is cheaper than looping
+    debs, archs, relations = zip(*variants)
+    names = list(map(operator.itemgetter(0), debs))
+    versions = list(map(operator.itemgetter(1), debs))
+    suites = list(itertools.chain.from_iterable(
+        itertools.repeat(_suiteForFilename(filename),
+                         len(debsForFilename[filename]))
+        for filename in filenames))
+    debForName = dict(zip(names, debs))
+    suiteForName = dict(zip(names, suites))
+    relationsForName = dict(zip(names, relations))
+    namesForArch = {arch: set(itertools.compress(names, map(arch.__eq__,
+                                                            archs)))
+                    for arch in set(archs)}
+    versionsForName = {}
+    if len(names) > len(debForName): # Some names have > 1 Deb
+        pairs = set(zip(names, versions))
+        if len(pairs) > len(debForName): # Some names have > 1 version
+            _mergeVersions(names, versions, suites, archs, debs,
+                           relations, pairs, preferredArchs, debForName,
+                           suiteForName, relationsForName,
+                           versionsForName)
+    descForName = {}
+    for data in descForNames:
+        descForName.update(data)
+    if descForName: # Use the translated descriptions where there are any
+        columns = list(zip(*debForName.values()))
+        i = Deb._fields.index('desc')
+        columns[i] = map(descForName.get, debForName.keys(), columns[i])
+        debForName = dict(zip(debForName.keys(),
+                              itertools.starmap(Deb, zip(*columns))))
+    return _Packages(debForName, namesForArch, suiteForName,
+                     versionsForName, relationsForName)
+
+
+def _buildCache(dataDir, filename, timer):
+    '''Reads and indexes the Packages files in dataDir, writes the index
+    to filename, and returns the PhaseEvents (for Model._buildInChild())
+    '''
+    global DATA_DIR
+    DATA_DIR = dataDir # This may be a new process
+    log = EventLog()
+    events = _Events(log, timer)
+    index = _Index(_readPackages(_ignore, timer, events), _ignore, events)
+    start = time.monotonic()
+    IndexFile.write(filename, index.todict, CACHE_VERSION)
+    events('saveCache', start, items=len(index),
+           size=os.path.getsize(filename))
+    return log
+
+
+def _worker(function):
+    if PROFILE_DIR:
+        import Profiler
+        return functools.partial(Profiler.profiled, PROFILE_DIR, 'load',
+                                 function)
+    return function
+
+
+def _initWorker(progress):
+    global _progress
+    _progress = progress
+
+
+def _readPackageFile(filename):
+    start = time.monotonic()
+    try:
+        state = _State()
+        debs = [] # (Deb, arch, relations) 3-tuples
+        deb = _Deb(_archForFilename(filename))
+        progress = _Progress()
+        with _openList(filename) as (file, raw):
+            for lino, line in enumerate(file, 1):
+                _readPackageLine(filename, lino, line, debs, deb, state)
+                if not lino % _PROGRESS_LINES:
+                    progress.update(raw, len(debs))
+            progress.update(raw, len(debs))
+        if deb.valid:
+            debs.append(deb.variant)
+    except OSError as err:
+        print(err)
+    return _workerResult(debs, filename, start)
+
+
+def _readPackageLine(filename, lino, line, debs, deb, state):
+    if not line.strip():
+        if deb.valid:
+            debs.append(deb.variant)
+        deb.clear()
+        return
+    if state.inDescription or state.inContinuation:
+        if line.startswith((' ', '\t')):
+            if state.inDescription:
+                deb.desc += line
+            return
+        state.inDescription = state.inContinuation = False
+    key, value, ok = _maybeKeyValue(line)
+    if not ok:
+        state.inContinuation = True
+    else:
+        state.inDescription = deb.update(key, value)
+
+
+def _readStatusFile(filename):
+    '''Returns a dict of the installed packages' versions (key = name)
+    read from a dpkg status file: if more than one architecture of a
+    package is installed the native (or arch all) one's version is used
+    '''
+    debs = [] # (Deb, arch, relations) 3-tuples
+    try:
+        state = _State()
+        deb = _StatusDeb(_nativeArch())
+        with _openList(filename) as (file, _):
+            for lino, line in enumerate(file, 1):
+                _readPackageLine(filename, lino, line, debs, deb, state)
+        if deb.valid:
+            debs.append(deb.variant)
+    except OSError as err:
+        print(err)
+    preferredArchs = {_nativeArch(), ALL_ARCH}
+    debs.sort(key=lambda variant: variant[1] in preferredArchs) # Stable
+    return {deb.name: deb.version for deb, _, _ in debs}
+
+
+def _readDescFile(filename):
+    import regex as re
+    start = time.monotonic()
+    descRx = re.compile(r'Description(:?-\w+)?:\s+')
+    inList = False
+    nameForDesc = {}
+    name = None
+    desc = []
+    try:
+        progress = _Progress()
+        with _openList(filename) as (file, raw):
+            for lino, line in enumerate(file, 1):
+                if not lino % _PROGRESS_LINES:
+                    progress.update(raw, len(nameForDesc))
+                if name is None:
+                    if line.startswith('Package:'):
+                        if name is not None:
+                            if inList:
+                                inList = False
+                                desc.append('\v-')
+                            nameForDesc[name] = ' '.join(desc).strip()
+                            desc.clear()
+                        name = line[8:].strip()
+                elif line.startswith('Description-md5'):
+                    continue
+                else: # start of desc or in desc or end of desc
+                    match = descRx.match(line)
+                    if match is not None:
+                        desc = [line[match.end():].strip(), '\n']
+                    else:
+                        line = line.rstrip()
+                        if not line:
+                            nameForDesc[name] = ' '.join(desc).strip()
+                            name = None
+                            desc.clear()
+                        if line == ' .':
+                            if inList:
+                                inList = False
+                                desc.append('\v-')
+                            desc.append('\n')
+                        elif line.lstrip().startswith(('* ', '- ')):
+                            if not inList:
+                                desc.append('\v+')
+                                inList = True
+                            desc.append(f'\t{line.lstrip()[2:]}')
+                        else:
+                            if inList:
+                                inList = False
+                                desc.append('\v-')
+                            desc.append(line)
+            progress.update(raw, len(nameForDesc))
+        if name is not None:
+            if inList:
+                inList = False
+                desc.append('\v-')
+            nameForDesc[name] = ''.join(desc).strip()
+    except OSError as err:
+        print(err)
+    return _workerResult(nameForDesc, filename, start)
+
+
+_progress = None # A worker's shared progress counters
+_PROGRESS_LINES = 1024 # How often workers update the progress counters
+
+
+def _workerResult(data, filename, start):
+    '''Returns the pickled data and _WorkerStats: the data is
+    pickled here (and unpickled by _readPackages()) so that the cost of
+    passing it between processes can be measured'''
+    parsed = time.monotonic()
+    payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    size = 0
+    with contextlib.suppress(OSError):
+        size = os.path.getsize(filename)
+    return payload, _WorkerStats(parsed - start, time.monotonic() - parsed,
+                                 size, len(data))
+
+
+def _mpContext():
+    import multiprocessing
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context(
+        'forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class _Progress:
+    '''Adds a worker's progress through a file to the shared progress
+    counters (bytes, stanzas) that were given to _initWorker()'''
+
+    def __init__(self):
+        self.bytes = 0
+        self.items = 0
+
+
+    def update(self, raw, items):
+        size = raw.tell() # Includes the read-ahead
+        if _progress is not None:
+            with _progress.get_lock():
+                _progress[0] += size - self.bytes
+                _progress[1] += items - self.items
+        self.bytes = size
+        self.items = items
+
+
+@contextlib.contextmanager
+def _openList(filename):
+    '''Yields a (file, raw) 2-tuple: a text file of the given list file's
+    contents and the binary file it is read from (whose position is how
+    far through the file on disk reading has got). Compressed lists are
+    decompressed by a _Pipeline.'''
+    with open(filename, 'rb') as raw:
+        suffix = os.path.splitext(filename)[1]
+        if suffix in COMPRESSION_SUFFIXES:
+            threaded = (os.cpu_count() or 1) > 1 and os.path.getsize(
+                filename) >= PIPELINE_MIN_SIZE
+            binary = io.BufferedReader(_Pipeline(
+                _decompressor(filename, suffix, raw), filename,
+                threaded=threaded), PIPELINE_CHUNK_SIZE)
+        else:
+            binary = raw
+        with io.TextIOWrapper(binary, encoding='utf-8') as file:
+            yield file, raw
+
+
+def _decompressor(filename, suffix, raw):
+    if suffix == '.gz':
+        import gzip
+        return gzip.GzipFile(fileobj=raw)
+    if suffix == '.xz':
+        import lzma
+        return lzma.LZMAFile(raw)
+    if suffix == '.bz2':
+        import bz2
+        return bz2.BZ2File(raw)
+    try:
+        import lz4.frame
+    except ImportError:
+        raise OSError(f'{filename}: reading .lz4 files needs the lz4 '
+                      'module (python3-lz4)') from None
+    return lz4.frame.LZ4FrameFile(raw)
+
+
+class _Pipeline(io.RawIOBase):
+    '''A binary stream of the data read from decompressor: if threaded,
+    by a background thread, so decompressing (which releases the GIL)
+    overlaps with parsing. Decompression errors are raised as OSErrors.
+    '''
+
+    def __init__(self, decompressor, filename, *, threaded=True):
+        self._decompressor = decompressor
+        self._filename = filename
+        self._chunks = queue.Queue(PIPELINE_CHUNKS)
+        self._chunk = memoryview(b'')
+        self._done = False
+        self._stop = threading.Event()
+        self._thread = None
+        if threaded:
+            self._thread = threading.Thread(target=self._decompress,
+                                            daemon=True)
+            self._thread.start()
+
+
+    def _decompress(self):
+        try:
+            while not self._stop.is_set():
+                chunk = self._decompressor.read(PIPELINE_CHUNK_SIZE)
+                self._chunks.put(chunk)
+                if not chunk:
+                    break
+        except Exception as err: # e.g., EOFError, lzma.LZMAError
+            self._chunks.put(OSError(f'{self._filename}: {err}'))
+
+
+    def readable(self):
+        return True
+
+
+    def readinto(self, buffer):
+        if self._thread is None:
+            try:
+                data = self._decompressor.read(len(buffer))
+            except Exception as err:
+                raise OSError(f'{self._filename}: {err}') from err
+            buffer[:len(data)] = data
+            return len(data)
+        while not self._chunk:
+            if self._done:
+                return 0
+            chunk = self._chunks.get()
+            if isinstance(chunk, OSError):
+                self._done = True
+                raise chunk
+            if not chunk:
+                self._done = True
+                return 0
+            self._chunk = memoryview(chunk)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+    def close(self):
+        if not self.closed:
+            if self._thread is not None:
+                self._stop.set()
+                with contextlib.suppress(queue.Empty):
+                    while True: # Unblock the thread if it's waiting to put
+                        self._chunks.get_nowait()
+                self._thread.join()
+            self._decompressor.close()
+        super().close()
+
+
+def _progressMessage(progress, totalSize, seconds):
+    size, items = progress[:]
+    rate = size / seconds
+    message = (f'Reading Packages files… {size / 1e6:,.0f} of '
+               f'{totalSize / 1e6:,.0f}MB, {items:,d} stanzas '
+               f'({rate / 1e6:0.1f}MB/s')
+    if rate:
+        message += f', about {max(0, totalSize - size) / rate:0.0f}sec left'
+    return message + ')'
+
+
 class _State:
 
     def __init__(self):
@@ -435,10 +2225,362 @@ class _State:
         self.inContinuation = False
 
 
+def _ignore(message, done):
+    pass
+
+
+def _memoryUse(value):
+    '''Returns a (private, mapped) 2-tuple of the approximate number of
+    bytes used by value: a list or mapped table of strs, an array or
+    memoryview, a Postings, or a str → Postings dict or mapped table'''
+    if isinstance(value, (memoryview, IndexFile.StringTable,
+                          IndexFile.PostingsTable)):
+        return 0, value.nbytes
+    if isinstance(value, Postings):
+        return value.nbytes, 0
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            sys.getsizeof(key) + postings.nbytes
+            for key, postings in value.items()), 0
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item)
+                                          for item in value), 0
+    return sys.getsizeof(value), 0
+
+
+def _sumUse(*uses):
+    return (sum(private for private, _ in uses),
+            sum(mapped for _, mapped in uses))
+
+
+def _asUse(use):
+    private, mapped = use
+    return dict(private=private, mapped=mapped)
+
+
+def _termBuckets(idsForTerm):
+    '''Returns a list of the bytes used by the terms with 1 ID, 2-3
+    IDs, 4-7 IDs, etc.'''
+    buckets = []
+    mapped = isinstance(idsForTerm, IndexFile.PostingsTable)
+    for term, ids in idsForTerm.items():
+        count = len(ids)
+        bucket = max(0, count.bit_length() - 1)
+        while len(buckets) <= bucket:
+            buckets.append(dict(minIds=1 << len(buckets), terms=0, ids=0,
+                                private=0, mapped=0))
+        use = buckets[bucket]
+        use['terms'] += 1
+        use['ids'] += count
+        if mapped:
+            use['mapped'] += idsForTerm.nbytesFor(term)
+        else:
+            use['private'] += sys.getsizeof(term) + ids.nbytes
+    return buckets
+
+
+def _peakMemory():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _isFresh(filename):
+    '''Returns True if filename exists and is at least as new as all
+    the files in DATA_DIR'''
+    try:
+        mtime = os.stat(filename).st_mtime
+        with os.scandir(DATA_DIR) as entries:
+            return all(entry.stat().st_mtime <= mtime for entry in entries
+                       if entry.is_file())
+    except OSError:
+        return False
+
+
+def _statusKey():
+    '''Returns what identifies the dpkg status file's current contents
+    (dpkg replaces it rather than writing to it), or None if it doesn't
+    exist'''
+    try:
+        stat = os.stat(DPKG_STATUS_FILENAME)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+    except OSError:
+        return None
+
+
+def _nativeArch():
+    if NATIVE_ARCH is not None:
+        return NATIVE_ARCH
+    machine = os.uname().machine
+    if sys.maxsize <= 2 ** 32 and machine == 'x86_64':
+        return 'i386' # 32-bit userland on a 64-bit kernel
+    return _ARCH_FOR_MACHINE.get(machine, machine)
+
+
+_ARCH_FOR_MACHINE = {'x86_64': 'amd64', 'i686': 'i386', 'i586': 'i386',
+                     'aarch64': 'arm64', 'armv7l': 'armhf',
+                     'armv6l': 'armel', 'ppc64le': 'ppc64el',
+                     'mips64': 'mips64el'}
+
+
+def _archForFilename(filename):
+    '''Returns the architecture of a Packages file named as apt does,
+    e.g., ..._binary-arm64_Packages, or the native one'''
+    name = os.path.basename(filename)
+    i = name.rfind('binary-')
+    if i == -1:
+        return _nativeArch()
+    return name[i + len('binary-'):].split('_', 1)[0]
+
+
+@contextlib.contextmanager
+def _gcPaused():
+    '''Merging creates many objects but no reference cycles, so the
+    garbage collections that creating them would trigger (each visiting
+    every object read so far) only cost time'''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _mergeVersions(names, versions, suites, archs, debs, relations,
+                   pairs, preferredArchs, debForName, suiteForName,
+                   relationsForName, versionsForName):
+    '''Sets the candidate Deb, suite, and relations of each name with
+    more than one version (all from the same variant: the last of the
+    preferred arch variants, or if there are none of any, with the
+    highest version, the variants being in _merge()'s order) and adds
+    the name's (version, suite) 2-tuples (candidate first, then in
+    descending version order) to versionsForName'''
+    countForName = collections.Counter(map(operator.itemgetter(0), pairs))
+    several = {name for name, count in countForName.items() if count > 1}
+    selected = list(map(several.__contains__, names))
+    names, versions, suites, archs, debs, relations = (
+        list(itertools.compress(values, selected))
+        for values in (names, versions, suites, archs, debs, relations))
+    preferred = list(map(preferredArchs.__contains__, archs))
+    # Each distinct version is compared once, when ranking them (0 for
+    # the highest); versions dpkg considers equal (e.g., 1.0 and 1.0-0)
+    # share a rank
+    keyForVersion = {version: _versionKey(version)
+                     for version in set(versions)}
+    rankForKey = {key: rank for rank, key in enumerate(
+        sorted(set(keyForVersion.values()), reverse=True))}
+    rankForVersion = {version: rankForKey[key]
+                      for version, key in keyForVersion.items()}
+    # Later items replace earlier ones, so each name's candidate variant
+    # is the last of its preferred arch variants (if any) with its
+    # highest version: a foreign arch's higher version (e.g., a binNMU)
+    # is only listed
+    order = sorted(range(len(names)), key=lambda i: (
+        preferred[i], -rankForVersion[versions[i]], i))
+    candidateForName = dict(zip(map(names.__getitem__, order), order))
+    for name, version, suite in set(zip(names, versions, suites)):
+        versionsForName.setdefault(name, []).append((version, suite))
+    for name, i in candidateForName.items():
+        debForName[name] = debs[i]
+        suiteForName[name] = suites[i]
+        relationsForName[name] = relations[i]
+        available = versionsForName[name]
+        # The version string breaks ties between equal versions
+        available.sort(key=lambda pair: (rankForVersion[pair[0]], pair))
+        available.remove((versions[i], suites[i]))
+        available.insert(0, (versions[i], suites[i]))
+
+
+def _dependencyGraphs(names, relationsForName):
+    '''Returns a (depends, rdepends, idsForProvided) 3-tuple: depends has
+    each ID's edges to the IDs of the packages it has relations with,
+    i.e., to the named package (unless it is virtual) and to every
+    package that Provides the name, each edge's kinds being its Relation
+    values OR-ed together; rdepends has the same edges reversed; and
+    idsForProvided is a dict whose keys are the Provided names and whose
+    values are lists of the IDs that provide them.
+
+    Edges are made, merged, and sorted as source * stride + target ints
+    (where stride is one more than the number of IDs, so that a target
+    of len(names) can stand for a name that isn't a package) using
+    builtins (map(), set operations, etc.) rather than by visiting each
+    package's relations one by one.'''
+    count = len(names)
+    stride = count + 1
+    import regex as re
+    # Version constraints, :any, [arch] restrictions, etc., are skipped
+    findall = re.compile(r'(?:^|[,|])\s*([a-z0-9][a-z0-9+.-]*)').findall
+    idForName = dict(zip(names, range(count)))
+    columns = list(zip(*map(relationsForName.__getitem__, names))) or [
+        ()] * len(_RELATION_FIELDS)
+    # key = provided (e.g., virtual) name, value = IDs that provide it
+    idsForProvided = {}
+    for id, text in enumerate(columns[_RELATION_INDEX['Provides']]):
+        if text:
+            for name in findall(text):
+                idsForProvided.setdefault(name, []).append(id)
+    kindForEdge = {}
+    for relation, texts in zip(Relation, columns):
+        found = list(map(findall, itertools.compress(texts, texts)))
+        sources = list(itertools.chain.from_iterable(map(
+            itertools.repeat, itertools.compress(range(count), texts),
+            map(len, found))))
+        dependencies = list(itertools.chain.from_iterable(found))
+        edges = set(map(operator.add, map(operator.mul, sources,
+                                          itertools.repeat(stride)),
+                        map(idForName.get, dependencies,
+                            itertools.repeat(count))))
+        if idsForProvided:
+            provided = list(map(idsForProvided.__contains__, dependencies))
+            for source, dependency in zip(
+                    itertools.compress(sources, provided),
+                    itertools.compress(dependencies, provided)):
+                edges.update(source * stride + target
+                             for target in idsForProvided[dependency])
+        both = edges & kindForEdge.keys() # Usually few
+        for edge in both:
+            kindForEdge[edge] |= relation.value
+        kindForEdge.update(dict.fromkeys(edges - both, relation.value))
+    # Drop the edges to names that aren't packages and to themselves
+    for edge in itertools.chain(range(count, count * stride, stride),
+                                range(0, count * stride, stride + 1)):
+        kindForEdge.pop(edge, None)
+    edges = sorted(kindForEdge)
+    kinds = list(map(kindForEdge.__getitem__, edges))
+    sources = list(map(operator.floordiv, edges, itertools.repeat(stride)))
+    targets = list(map(operator.mod, edges, itertools.repeat(stride)))
+    depends = _graph(sources, targets, kinds, count)
+    # A stable sort by target keeps each target's sources in order
+    order = sorted(range(len(edges)), key=targets.__getitem__)
+    rdepends = _graph(list(map(targets.__getitem__, order)),
+                      list(map(sources.__getitem__, order)),
+                      list(map(kinds.__getitem__, order)), count)
+    return depends, rdepends, idsForProvided
+
+
+def _graph(sources, targets, kinds, count):
+    '''Returns the _Graph of the edges sorted by source then target'''
+    countForSource = collections.Counter(sources)
+    return _Graph(
+        array.array('I', itertools.accumulate(itertools.chain((0,), map(
+            countForSource.get, range(count), itertools.repeat(0))))),
+        array.array('I', targets), array.array('B', kinds))
+
+
+# The relation fields read from Packages files in _Deb.relations order:
+# one for each Relation (in order), then Provides
+_RELATION_FIELDS = ('Depends', 'Pre-Depends', 'Recommends', 'Suggests',
+                    'Provides')
+_RELATION_INDEX = {field: i for i, field in enumerate(_RELATION_FIELDS)}
+
+
+def _suiteForFilename(filename):
+    '''Returns the suite of a Packages file named as apt does, e.g.,
+    ..._dists_bookworm-updates_main_binary-amd64_Packages, or for a flat
+    repository, the part of its name before _Packages'''
+    name = os.path.basename(filename)
+    i = name.find('_dists_')
+    if i == -1:
+        return name.split('_Packages', 1)[0]
+    return name[i + len('_dists_'):].split('_', 1)[0]
+
+
+def _versionKey(version):
+    '''Returns a key for sorting Debian version strings (epoch:upstream-
+    revision) in the order dpkg compares them (see deb-version(7))'''
+    epoch, colon, rest = version.partition(':')
+    if not colon:
+        epoch, rest = '0', version
+    upstream, hyphen, revision = rest.rpartition('-')
+    if not hyphen:
+        upstream, revision = rest, ''
+    return (int(epoch) if epoch.isdigit() else 0,
+            _versionPartsKey(upstream), _versionPartsKey(revision))
+
+
+def _versionPartsKey(text):
+    # Alternating non-digit parts (compared character by character with
+    # ~ before the end, which is before letters, which are before other
+    # characters) and digit parts (compared as ints); an absent part is
+    # '' or 0, so trailing ('', 0) pairs are dropped, and (0,) marks
+    # the end. Only the first non-digit part can be '' (i.e., (0,)), so
+    # the first pair is always kept: that way the end marker is only
+    # ever compared with another end marker or with a non-empty part
+    # (which it sorts after if it starts with ~ and before otherwise),
+    # never with an empty part that might be followed by a non-zero one
+    import regex as re
+    key = []
+    for nonDigits, digits in re.findall(r'(\D*)(\d*)', text):
+        key.append(tuple(map(_versionCharOrder, nonDigits)) + (0,))
+        key.append(int(digits or 0))
+    while len(key) > 2 and key[-2:] == [(0,), 0]:
+        del key[-2:]
+    key.append((0,))
+    return tuple(key)
+
+
+def _versionCharOrder(c):
+    if c == '~':
+        return -1
+    if 'a' <= c <= 'z' or 'A' <= c <= 'Z':
+        return ord(c)
+    return ord(c) + 256
+
+
+def _find(names, name):
+    '''Returns the index of name in the sorted list or StringTable of
+    names, or -1'''
+    i = bisect.bisect_left(names, name)
+    if i < len(names) and names[i] == name:
+        return i
+    return -1
+
+
 def _genericSection(section):
     return section.split('/')[-1]
 
 
+@functools.lru_cache(maxsize=4096)
+def _canonicalWords(words, match):
+    if not words:
+        return None, Match.ALL_WORDS
+    stems = tuple(sorted(set(_stemmedWords(words))))
+    if len(stems) < 2: # All and Any are the same for 0 or 1 words
+        match = Match.ALL_WORDS
+    return stems, match
+
+
+def _addId(idsForKey, key, id):
+    ids = idsForKey.setdefault(key, [])
+    if not ids or ids[-1] != id: # A word may occur more than once
+        ids.append(id)
+
+
+def _postingsForKey(idsForKey):
+    return {key: Postings(ids) for key, ids in idsForKey.items()}
+
+
+def _ranks(keys):
+    '''Given keys in ID order returns a (rank, ids) 2-tuple of arrays
+    where rank[id] is the ID's position in key order and ids[rank] is
+    the ID at that position (stable, so ties are in ID, i.e., name order)
+    '''
+    ids = array.array('I', sorted(range(len(keys)), key=keys.__getitem__))
+    rank = array.array('I', bytes(ids.itemsize * len(ids)))
+    for position, id in enumerate(ids):
+        rank[id] = position
+    return rank, ids
+
+
+def _isLib(name):
+    return (not name.startswith('libre') and
+            (name.startswith('lib') or '-lib' in name))
+
+
+def _isDoc(name):
+    return name.endswith(('-doc', '-docs'))
+
+
 def _maybeKeyValue(line):
     i = line.find(':')
     if i == -1:
@@ -449,6 +2591,8 @@ def _maybeKeyValue(line):
 
 
 def _stemmedWords(line):
+    import regex as re
+    import Stemmer
     nonLetterRx = re.compile(r'\P{L}+')
     stemmer = Stemmer.Stemmer('en')
     return [word for word in stemmer.stemWords(
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# Copyright © 2020 Qtrac Ltd. All rights reserved.
+
+'''Postings is an immutable Roaring-style compressed set of package IDs.
+
+IDs are split into a high 16-bit key and a low 16-bit value. Each key
+has a container holding its low values: a sorted array('H') when there
+are at most ARRAY_MAX values, or a 65,536-bit bitmap (held as a Python
+int so that AND, OR, ANDNOT, and popcount run in C) when there are more.
+'''
+
+import array
+import bisect
+import struct
+import sys
+
+
+ARRAY_MAX = 4096
+CHUNK_BITS = 16
+CHUNK_SIZE = 1 << CHUNK_BITS
+LOW_MASK = CHUNK_SIZE - 1
+BITMAP_BYTES = CHUNK_SIZE // 8
+
+_HEADER = struct.Struct('<I')
+_CONTAINER = struct.Struct('<HBI') # key, kind, count
+_ARRAY = 0
+_BITMAP = 1
+
+
+class Postings:
+
+    __slots__ = ('_containers',)
+
+    def __init__(self, ids=()):
+        '''ids is an iterable of nonnegative ints in any order'''
+        self._containers = {} # key = high 16 bits, value = container
+        values = sorted(set(ids))
+        start = 0
+        while start < len(values):
+            key = values[start] >> CHUNK_BITS
+            end = start
+            while (end < len(values) and
+                    values[end] >> CHUNK_BITS == key):
+                end += 1
+            self._containers[key] = _optimized(array.array(
+                'H', (value & LOW_MASK for value in values[start:end])))
+            start = end
+
+
+    @classmethod
+    def fromRange(cls, size):
+        '''Returns Postings for all the IDs in range(size)'''
+        containers = {}
+        for key in range((size + LOW_MASK) >> CHUNK_BITS):
+            count = min(CHUNK_SIZE, size - (key << CHUNK_BITS))
+            containers[key] = _optimized((1 << count) - 1)
+        return cls._make(containers)
+
+
+    @classmethod
+    def _make(cls, containers):
+        postings = cls.__new__(cls)
+        postings._containers = containers
+        return postings
+
+
+    def __len__(self):
+        return sum(_count(container)
+                   for container in self._containers.values())
+
+
+    def __bool__(self):
+        return bool(self._containers)
+
+
+    def __iter__(self):
+        for key, container in self._containers.items():
+            base = key << CHUNK_BITS
+            for value in _values(container):
+                yield base | value
+
+
+    def __contains__(self, id):
+        container = self._containers.get(id >> CHUNK_BITS)
+        if container is None:
+            return False
+        value = id & LOW_MASK
+        if isinstance(container, int):
+            return bool(container >> value & 1)
+        index = bisect.bisect_left(container, value)
+        return index < len(container) and container[index] == value
+
+
+    def __eq__(self, other):
+        if not isinstance(other, Postings):
+            return NotImplemented
+        return self._containers == other._containers
+
+
+    def __repr__(self):
+        return f'Postings({list(self)!r})'
+
+
+    @property
+    def nbytes(self):
+        '''Returns the number of bytes of memory used'''
+        return (sys.getsizeof(self) + sys.getsizeof(self._containers) +
+                sum(sys.getsizeof(container)
+                    for container in self._containers.values()))
+
+
+    def __and__(self, other):
+        mine = self._containers
+        theirs = other._containers
+        if len(theirs) < len(mine):
+            mine, theirs = theirs, mine
+        containers = {}
+        for key, container in mine.items():
+            their = theirs.get(key)
+            if their is not None:
+                container = _and(container, their)
+                if container:
+                    containers[key] = container
+        return Postings._make(containers)
+
+
+    def __or__(self, other):
+        containers = {}
+        for key in sorted(self._containers.keys() |
+                          other._containers.keys()):
+            mine = self._containers.get(key)
+            their = other._containers.get(key)
+            if mine is None:
+                containers[key] = their
+            elif their is None:
+                containers[key] = mine
+            else:
+                containers[key] = _or(mine, their)
+        return Postings._make(containers)
+
+
+    def __sub__(self, other):
+        '''ANDNOT'''
+        containers = {}
+        for key, container in self._containers.items():
+            their = other._containers.get(key)
+            if their is not None:
+                container = _andNot(container, their)
+            if container:
+                containers[key] = container
+        return Postings._make(containers)
+
+
+    def intersectionCount(self, other):
+        '''Returns len(self & other) without materializing the result'''
+        count = 0
+        for key, container in self._containers.items():
+            their = other._containers.get(key)
+            if their is not None:
+                count += _andCount(container, their)
+        return count
+
+
+    @staticmethod
+    def union(postings):
+        '''Returns the union of all the given postings'''
+        result = Postings()
+        for posting in postings:
+            result |= posting
+        return result
+
+
+    @staticmethod
+    def intersection(postings):
+        '''Returns the intersection of all the given postings (smallest
+        first so that the intermediate results shrink quickly)'''
+        postings = sorted(postings, key=len)
+        if not postings:
+            return Postings()
+        result = postings[0]
+        for posting in postings[1:]:
+            if not result:
+                break
+            result &= posting
+        return result
+
+
+    def tobytes(self):
+        parts = [_HEADER.pack(len(self._containers))]
+        for key, container in self._containers.items():
+            if isinstance(container, int):
+                parts.append(_CONTAINER.pack(key, _BITMAP,
+                                             container.bit_count()))
+                parts.append(container.to_bytes(BITMAP_BYTES, 'little'))
+            else:
+                parts.append(_CONTAINER.pack(key, _ARRAY, len(container)))
+                parts.append(_littleEndian(container).tobytes())
+        return b''.join(parts)
+
+
+    @classmethod
+    def frombytes(cls, data):
+        data = memoryview(data)
+        containers = {}
+        (size,) = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        for _ in range(size):
+            key, kind, count = _CONTAINER.unpack_from(data, offset)
+            offset += _CONTAINER.size
+            if kind == _BITMAP:
+                end = offset + BITMAP_BYTES
+                containers[key] = int.from_bytes(data[offset:end],
+                                                 'little')
+            else:
+                end = offset + (count * 2)
+                container = array.array('H')
+                container.frombytes(data[offset:end])
+                containers[key] = _littleEndian(container)
+            offset = end
+        return cls._make(containers)
+
+
+    def __reduce__(self):
+        return (_frombytes, (self.tobytes(),))
+
+
+def _frombytes(data):
+    return Postings.frombytes(data)
+
+
+def _count(container):
+    if isinstance(container, int):
+        return container.bit_count()
+    return len(container)
+
+
+def _values(container):
+    if isinstance(container, int):
+        return _bitmapValues(container)
+    return container
+
+
+def _bitmapValues(bitmap):
+    data = bitmap.to_bytes(BITMAP_BYTES, 'little')
+    for index, byte in enumerate(data):
+        if byte:
+            base = index << 3
+            for bit in _BITS_FOR_BYTE[byte]:
+                yield base | bit
+
+
+def _toArray(bitmap):
+    return array.array('H', _bitmapValues(bitmap))
+
+
+def _toBitmap(values):
+    data = bytearray(BITMAP_BYTES)
+    for value in values:
+        data[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _optimized(container):
+    '''Returns the container in its most compact form'''
+    if isinstance(container, int):
+        if container.bit_count() <= ARRAY_MAX:
+            return _toArray(container)
+        return container
+    if len(container) > ARRAY_MAX:
+        return _toBitmap(container)
+    return container
+
+
+def _and(a, b):
+    if isinstance(a, int):
+        if isinstance(b, int):
+            return _optimized(a & b)
+        a, b = b, a
+    if isinstance(b, int):
+        data = b.to_bytes(BITMAP_BYTES, 'little')
+        return array.array('H', (value for value in a
+                                 if data[value >> 3] >> (value & 7) & 1))
+    if len(b) < len(a):
+        a, b = b, a
+    return array.array('H', sorted(set(a).intersection(b)))
+
+
+def _andCount(a, b):
+    if isinstance(a, int):
+        if isinstance(b, int):
+            return (a & b).bit_count()
+        a, b = b, a
+    if isinstance(b, int):
+        data = b.to_bytes(BITMAP_BYTES, 'little')
+        return sum(data[value >> 3] >> (value & 7) & 1 for value in a)
+    if len(b) < len(a):
+        a, b = b, a
+    return len(set(a).intersection(b))
+
+
+def _or(a, b):
+    if isinstance(a, int):
+        if isinstance(b, int):
+            return a | b
+        return a | _toBitmap(b)
+    if isinstance(b, int):
+        return _toBitmap(a) | b
+    return _optimized(array.array('H', sorted(set(a).union(b))))
+
+
+def _andNot(a, b):
+    if isinstance(a, int):
+        if isinstance(b, int):
+            return _optimized(a & ~b)
+        return _optimized(a & ~_toBitmap(b))
+    if isinstance(b, int):
+        data = b.to_bytes(BITMAP_BYTES, 'little')
+        return array.array('H', (value for value in a
+                                 if not data[value >> 3] >> (value & 7) & 1))
+    return array.array('H', sorted(set(a).difference(b)))
+
+
+def _littleEndian(container):
+    if _BIG_ENDIAN:
+        container = array.array('H', container)
+        container.byteswap()
+    return container
+
+
+_BIG_ENDIAN = array.array('H', [1]).tobytes() == b'\0\1'
+_BITS_FOR_BYTE = tuple(tuple(bit for bit in range(8) if byte >> bit & 1)
+                       for byte in range(256))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# Copyright © 2020 Qtrac Ltd. All rights reserved.
+
+'''Profiling support: profile() runs code under cProfile and tracemalloc
+and writes, to the given directory, for the given name:
+
+    name.pstats             the merged cProfile stats (including those of
+                            any worker processes run via profiled())
+    name.txt                the top functions by cumulative time
+    name-allocations.txt    the top allocation sites at each mark()
+                            (e.g., for each load phase), and in each
+                            worker
+
+View a .pstats file with, e.g., python3 -m pstats name.pstats
+'''
+
+import contextlib
+import cProfile
+import glob
+import io
+import os
+import pstats
+import tempfile
+import tracemalloc
+
+
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 10
+TRACEBACK_FRAMES = 5
+
+
+class Profile:
+
+    def __init__(self, dirname, name):
+        self.dirname = dirname
+        self.name = name
+        self._allocations = io.StringIO()
+        self._snapshot = _snapshot()
+
+
+    def mark(self, phase):
+        '''Records the top allocation sites since the last mark'''
+        snapshot = _snapshot()
+        _writeAllocations(self._allocations, phase,
+                          snapshot.compare_to(self._snapshot, 'lineno'))
+        self._snapshot = snapshot
+
+
+@contextlib.contextmanager
+def profile(dirname, name):
+    '''Profiles the body of the with statement and yields a Profile
+    whose mark() method can be used to split allocations into phases'''
+    os.makedirs(dirname, exist_ok=True)
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start(TRACEBACK_FRAMES)
+    result = Profile(dirname, name)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        result.mark('end')
+        if not tracing:
+            tracemalloc.stop()
+        _writeResults(result, profiler)
+
+
+def profiled(dirname, name, function, *args):
+    '''Returns function(*args) having profiled it; for use in worker
+    processes, e.g., executor.submit(functools.partial(profiled, dirname,
+    name, function), *args), so that profile() can merge the results'''
+    tracemalloc.start(TRACEBACK_FRAMES)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        snapshot = _snapshot()
+        tracemalloc.stop()
+        fh, filename = tempfile.mkstemp(prefix=f'{name}-worker-',
+                                        suffix='.pstats', dir=dirname)
+        os.close(fh)
+        profiler.dump_stats(filename)
+        with open(filename.replace('.pstats', '.allocations'), 'wt',
+                  encoding='utf-8') as file:
+            _writeAllocations(file, f'worker {os.getpid()} {args!r}',
+                              snapshot.statistics('lineno'))
+
+
+def _writeResults(result, profiler):
+    prefix = os.path.join(result.dirname, result.name)
+    stats = pstats.Stats(profiler)
+    allocations = result._allocations
+    for filename in sorted(glob.glob(f'{prefix}-worker-*.pstats')):
+        stats.add(filename)
+        os.remove(filename)
+        filename = filename.replace('.pstats', '.allocations')
+        with contextlib.suppress(FileNotFoundError):
+            with open(filename, 'rt', encoding='utf-8') as file:
+                allocations.write(file.read())
+            os.remove(filename)
+    stats.dump_stats(f'{prefix}.pstats')
+    with open(f'{prefix}.txt', 'wt', encoding='utf-8') as file:
+        stats.stream = file
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(
+            TOP_FUNCTIONS)
+    with open(f'{prefix}-allocations.txt', 'wt', encoding='utf-8') as file:
+        file.write(allocations.getvalue())
+
+
+def _snapshot():
+    # Ignore tracemalloc's own allocations, e.g., for earlier snapshots
+    return tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),))
+
+
+def _writeAllocations(file, title, statistics):
+    file.write(f'{title}\n')
+    for statistic in statistics[:TOP_ALLOCATIONS]:
+        file.write(f'    {statistic}\n')
+    file.write('\n')
@@ -3,6 +3,7 @@
 
 import wx
 
+import Client
 import Const
 import DebView
 import Model
@@ -16,7 +17,12 @@ class Window(wx.Frame, WindowActions.Mixin, WindowUtil.Mixin):
         super().__init__(*args, **kwargs)
         self.Title = wx.App.Get().AppName
         self.helpForm = None
-        self.addIcons()
+        self.model = None # Set by loadModel()
+        self.sections = [''] # sectionChoice's sections; '' for Any
+        self.findId = 0
+        self.query = None
+        self.order = Model.Order.NAME
+        self.reverse = False
         self.makeWidgets()
         self.makeLayout()
         self.makeBindings()
@@ -24,6 +30,7 @@ class Window(wx.Frame, WindowActions.Mixin, WindowUtil.Mixin):
         self.descEdit.SetFocus()
         self.updateUi()
         wx.CallAfter(self.fixLayout)
+        wx.CallAfter(self.addIcons)
         wx.CallLater(100, self.loadModel)
 
 
@@ -93,6 +100,7 @@ class Window(wx.Frame, WindowActions.Mixin, WindowUtil.Mixin):
 
     def makeBindings(self):
         self.debsListCtrl.Bind(wx.EVT_LIST_ITEM_SELECTED, self.showDeb)
+        self.debsListCtrl.Bind(wx.EVT_LIST_COL_CLICK, self.onColumnClick)
         self.findButton.Bind(wx.EVT_BUTTON, self.onFind)
         self.refreshButton.Bind(wx.EVT_BUTTON, self.onRefresh)
         self.aboutButton.Bind(wx.EVT_BUTTON, self.onAbout)
@@ -134,30 +142,71 @@ class Window(wx.Frame, WindowActions.Mixin, WindowUtil.Mixin):
             button.SetMinSize(size)
 
 
-    def updateUi(self, enable=False):
+    def updateUi(self, enable=False, *, descs=True):
+        '''If enable is True and descs is False only names and sections
+        can be searched (while the descriptions are being indexed)'''
         self.findButton.Enable(enable)
-        self.refreshButton.Enable(enable)
+        self.refreshButton.Enable(enable and descs)
         self.debsListCtrl.Enable(enable)
         self.debView.Enable(enable)
+        for widget in (self.descEdit, self.descAllRadio, self.descAnyRadio):
+            widget.Enable(descs)
 
 
     def loadModel(self):
         wx.BeginBusyCursor()
-        self.model = Model.Model(self.onReady)
+        # Returns at once: the model is loaded in the background (so the
+        # window stays responsive and shows its progress) and
+        # onNamesReady() is called once names and sections can be searched
+        self.model = Client.model(self.onReady, staged=True,
+                                  onNamesReady=self.onNamesReady)
+
+
+    def onNamesReady(self):
+        # Called by a staged load's background thread or, for a daemon, by
+        # Client.model() before self.model is set
+        wx.CallAfter(self.namesReady)
+
+
+    def namesReady(self):
         self.updateSections()
+        if self.model.stage is Model.Stage.NAMES:
+            self.updateUi(True, descs=False)
+            self.nameEdit.SetFocus()
+            if wx.IsBusy():
+                wx.EndBusyCursor()
 
 
     def onReady(self, message, done):
+        if not wx.IsMainThread(): # A staged load's background thread
+            wx.CallAfter(self.onReady, message, done)
+            return
         self.SetStatusText(message)
         if done:
-            self.updateUi(True)
-            wx.EndBusyCursor()
-
-
-    def updateSections(self):
-        self.sectionChoice.Set(sorted(self.model.allSections))
-        self.sectionChoice.Insert([Const.ANY_SECTION], 0)
-        self.sectionChoice.Selection = 0
+            # If indexing the descriptions failed only names and sections
+            # can be searched
+            self.updateUi(True, descs=self.model is None or
+                          self.model.stage is not Model.Stage.NAMES)
+            if wx.IsBusy():
+                wx.EndBusyCursor()
+
+
+    def updateSections(self, countForSection=None):
+        '''If countForSection is given only the sections with hits are
+        shown (plus the current one), each with its count.'''
+        current = self.sections[max(0, self.sectionChoice.Selection)]
+        if countForSection is None:
+            self.sections = [''] + sorted(self.model.allSections)
+            labels = self.sections[1:]
+            current = ''
+        else:
+            self.sections = [''] + sorted(
+                section for section in self.model.allSections
+                if countForSection.get(section) or section == current)
+            labels = [f'{section} ({countForSection.get(section, 0):,d})'
+                      for section in self.sections[1:]]
+        self.sectionChoice.Set([Const.ANY_SECTION] + labels)
+        self.sectionChoice.Selection = self.sections.index(current)
 
 
     def showDeb(self, _event=None):
@@ -167,4 +216,5 @@ class Window(wx.Frame, WindowActions.Mixin, WindowUtil.Mixin):
             name = self.debsListCtrl.GetItemText(index)
             deb = self.model.debForName(name)
             if deb is not None:
-                self.debView.showDeb(deb)
+                self.debView.showDeb(deb, self.model.versionsForName(name),
+                                     self.model.installedVersion(name))
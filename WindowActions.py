@@ -2,59 +2,113 @@
 # Copyright © 2020 Qtrac Ltd. All rights reserved.
 
 import datetime
+import itertools
 import platform
 import sys
 import textwrap
 
-import regex as re
 import wx
-import wx.adv
 
 import Const
-import HelpForm
+import DebView
 import Model
 
+# wx.adv, HelpForm, and regex are imported when first needed so that the
+# window appears as soon as possible
+
 
 class Mixin:
 
     def onFind(self, _event=None):
         with wx.BusyCursor():
-            self.debView.clear()
-            self.debsListCtrl.ClearAll()
-            section = self.sectionChoice.GetString(
-                self.sectionChoice.CurrentSelection)
-            if section == Const.ANY_SECTION:
-                section = ''
+            section = self.sections[self.sectionChoice.Selection]
             descMatch = (Model.Match.ANY_WORD if self.descAnyRadio.Value
                          else Model.Match.ALL_WORDS)
             nameMatch = (Model.Match.ANY_WORD if self.nameAnyRadio.Value
                          else Model.Match.ALL_WORDS)
-            query = Model.Query(
-                section=section, descWords=self.descEdit.Value,
+            # The descriptions may not be searchable yet
+            descWords = (self.descEdit.Value if self.descEdit.Enabled else
+                         '')
+            self.query = Model.Query(
+                section=section, descWords=descWords,
                 descMatch=descMatch, nameWords=self.nameEdit.Value,
                 nameMatch=nameMatch, includeLibs=self.libCheckbox.Value,
                 includeDocs=self.docCheckbox.Value)
-            names = self.model.query(query)
-            if names:
-                if len(names) == 1:
+            self.updateSections(self.model.sectionCounts(self.query))
+            count = self.model.count(self.query)
+            if count:
+                if count == 1:
                     self.SetStatusText('Found one matching package.')
                 else:
                     self.SetStatusText(
-                        f'Found {len(names):,d} matching packages.')
-                self.debsListCtrl.AppendColumn('Name')
-                self.debsListCtrl.AppendColumn('Description')
-                for name in sorted(names):
-                    desc = _shortDesc(self.model.descForName(name))
-                    self.debsListCtrl.Append((name, desc))
-                self.debsListCtrl.SetColumnWidth(0, -1)
-                self.debsListCtrl.SetColumnWidth(1, -1)
-                self.debsListCtrl.Select(0)
-                self.debsListCtrl.SetFocus()
+                        f'Found {count:,d} matching packages.')
             else:
                 self.SetStatusText('No matching packages found.')
+            self.listDebs()
+
+
+    def onColumnClick(self, event):
+        order = COLUMN_ORDERS[event.Column]
+        if order is None or self.query is None:
+            return
+        if order is self.order:
+            self.reverse = not self.reverse
+        else:
+            self.order = order
+            self.reverse = False
+        with wx.BusyCursor():
+            self.listDebs()
+
+
+    def listDebs(self):
+        '''Shows the first page of the current query's names at once and
+        appends the rest a page at a time'''
+        self.debView.clear()
+        self.debsListCtrl.ClearAll()
+        self.findId += 1 # Stops appending any previous find's names
+        if not self.model.count(self.query):
+            return
+        for column in COLUMNS:
+            self.debsListCtrl.AppendColumn(column)
+        self.appendDebs(self.model.iterQuery(
+            self.query, order=self.order, reverse=self.reverse),
+            self.findId)
+        self.sizeColumns()
+        self.debsListCtrl.Select(0)
+        self.debsListCtrl.SetFocus()
+
+
+    def appendDebs(self, names, findId):
+        if findId != self.findId:
+            return
+        page = list(itertools.islice(names, Const.PAGE_SIZE))
+        # Installed packages' rows are marked by colour
+        for name, state in zip(page, self.model.installedStates(page)):
+            deb = self.model.debForName(name)
+            if deb is None: # Dropped by a refresh
+                continue
+            index = self.debsListCtrl.Append((
+                name, _shortDesc(deb.desc),
+                DebView.sizeof_fmt(deb.size, decs=0), deb.section))
+            if state is Model.Installed.INSTALLED:
+                self.debsListCtrl.SetItemTextColour(
+                    index, wx.Colour(Const.INSTALLED_COLOUR))
+            elif state is Model.Installed.UPGRADABLE:
+                self.debsListCtrl.SetItemTextColour(
+                    index, wx.Colour(Const.UPGRADABLE_COLOUR))
+        if len(page) == Const.PAGE_SIZE:
+            wx.CallAfter(self.appendDebs, names, findId)
+        elif self.debsListCtrl.ItemCount > len(page):
+            self.sizeColumns() # Fit the later pages' longer names, etc.
+
+
+    def sizeColumns(self):
+        for column in range(len(COLUMNS)):
+            self.debsListCtrl.SetColumnWidth(column, wx.LIST_AUTOSIZE)
 
 
     def onRefresh(self, _event=None):
+        self.findId += 1 # Stops appending the current find's names
         self.updateUi()
         self.sectionChoice.Clear()
         self.SetStatusText('Refreshing…')
@@ -63,11 +117,13 @@ class Mixin:
 
     def refresh(self):
         wx.BeginBusyCursor()
-        self.model.load(self.onReady, refresh=True)
-        self.updateSections()
+        # Returns at once so that the read's progress is shown as it goes
+        self.model.load(self.onReady, refresh=True, staged=True,
+                        onNamesReady=self.onNamesReady)
 
 
     def onAbout(self, _event=None):
+        import wx.adv
         app = wx.App.Get()
         info = wx.adv.AboutDialogInfo()
         info.Name = app.AppName
@@ -91,6 +147,7 @@ License: GPL-3.0.'''
 
     def onHelp(self, _event=None):
         if self.helpForm is None:
+            import HelpForm
             self.helpForm = HelpForm.Form(self)
         self.helpForm.Show()
         self.helpForm.Raise()
@@ -108,7 +165,13 @@ License: GPL-3.0.'''
         self.Destroy()
 
 
+COLUMNS = ('Name', 'Description', 'Size', 'Section')
+COLUMN_ORDERS = (Model.Order.NAME, None, Model.Order.SIZE,
+                 Model.Order.SECTION)
+
+
 def _shortDesc(desc):
+    import regex as re
     startRx = re.compile(r'(.*?)[.\n]')
     match = startRx.match(desc)
     if match is not None and match.end() > Const.MAX_DESC_LEN // 4:
@@ -4,12 +4,14 @@
 import wx
 
 import Const
-import Icons
 
 
 class Mixin:
 
     def addIcons(self):
+        '''Called once the window is shown since decoding the embedded
+        icons is slow'''
+        import Icons
         icons = wx.IconBundle()
         icons.AddIcon(Icons.icon16.Icon)
         icons.AddIcon(Icons.icon32.Icon)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# Copyright © 2020 Qtrac Ltd. All rights reserved.
+
+'''Benchmarks Model against synthetic corpora (see Corpus.py) of given
+sizes and writes the results as JSON, optionally comparing them with a
+previous run's.
+
+For each size it times reading the Packages files, indexing, saving and
+loading the cache, and a matrix of query shapes, each both cold (empty
+query cache) and warm. Every time is the best of --repeat runs. It also
+times reading the files when compressed with each of --compressors and
+reports every read's throughput in uncompressed MB/s.
+'''
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import Corpus
+import IndexFile
+import Model
+
+
+def queries(seed):
+    '''Returns a dict of name: Query keyword arguments, using words
+    from the corpus's vocabulary of known frequencies (and avoiding those
+    in Model._COMMON_STEMS, which aren't indexed)'''
+    words = Corpus.vocabulary(seed)
+    common = len(Corpus.COMMON_WORDS)
+    return {
+        'all': dict(),
+        'all+libs+docs': dict(includeLibs=True, includeDocs=True),
+        'section': dict(section='utils'),
+        'desc:common': dict(descWords='server'),
+        'desc:rare': dict(descWords=words[common + 5_000]),
+        'desc:all3': dict(descWords=' '.join(words[common:common + 3])),
+        'desc:any3': dict(descWords=' '.join(words[common:common + 3]),
+                          descMatch=Model.Match.ANY_WORD),
+        'name': dict(nameWords='python3'),
+        'section+desc': dict(section='net', descWords='server client',
+                             descMatch=Model.Match.ANY_WORD),
+        'size': dict(minSize=100, maxSize=5000),
+        'desc+size+libs': dict(descWords='shared', minSize=1000,
+                               includeLibs=True),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark Model on synthetic corpora.')
+    parser.add_argument('-s', '--sizes', default='1000,10000,100000',
+                        help='comma-separated package counts '
+                        '[default: %(default)s]')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='the corpus seed [default: %(default)s]')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='time each query this many times and keep '
+                        'the best [default: %(default)s]')
+    parser.add_argument('-z', '--compressors', default=_compressors(),
+                        help='comma-separated suffixes of the compressed '
+                        'lists to time reading [default: %(default)s]')
+    parser.add_argument('-o', '--output',
+                        help='write the JSON results here rather than to '
+                        'stdout')
+    parser.add_argument('-c', '--compare', metavar='JSON',
+                        help="report each time as a ratio of this earlier "
+                        "run's (on stderr)")
+    args = parser.parse_args()
+    results = dict(python=platform.python_version(),
+                   platform=platform.platform(), cpus=os.cpu_count(),
+                   seed=args.seed, repeat=args.repeat, sizes=[])
+    for count in (int(size) for size in args.sizes.split(',')):
+        print(f'Benchmarking {count:,d} packages…', file=sys.stderr)
+        results['sizes'].append(benchmark(
+            count, args.seed, args.repeat,
+            [suffix for suffix in args.compressors.split(',') if suffix]))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'wt', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, 'rt', encoding='utf-8') as file:
+            compare(json.load(file), results)
+
+
+def benchmark(count, seed, repeat, compressors=()):
+    with tempfile.TemporaryDirectory() as dirname:
+        Model.DATA_DIR = f'{dirname}/lists'
+        Model.SYSTEM_INDEX_FILENAME = f'{dirname}/system.index'
+        Model.CACHE_DIR = dirname
+        size = Corpus.write(Model.DATA_DIR, count, seed=seed)
+        phases = {}
+        throughput = {}
+        for suffix in compressors:
+            target = f'{dirname}/lists{suffix}'
+            phases[f'compressedBytes{suffix}'] = Corpus.compress(
+                Model.DATA_DIR, suffix, target=target)
+            Model.DATA_DIR = target
+            start = time.perf_counter()
+            Model._readPackages(_ignore, time.monotonic())
+            phases[f'readPackages{suffix}'] = time.perf_counter() - start
+            throughput[suffix] = _mbPerSecond(
+                size, phases[f'readPackages{suffix}'])
+            Model.DATA_DIR = f'{dirname}/lists'
+        start = time.perf_counter()
+        packages = Model._readPackages(_ignore, time.monotonic())
+        phases['readPackages'] = time.perf_counter() - start
+        throughput['uncompressed'] = _mbPerSecond(size,
+                                                  phases['readPackages'])
+        start = time.perf_counter()
+        index = Model._Index(packages, _ignore)
+        phases['indexPackages'] = time.perf_counter() - start
+        filename = Model.Model._cacheFilename()
+        start = time.perf_counter()
+        IndexFile.write(filename, index.todict, Model.CACHE_VERSION)
+        phases['saveCache'] = time.perf_counter() - start
+        phases['cacheBytes'] = os.path.getsize(filename)
+        start = time.perf_counter()
+        Model._Index.fromdict(IndexFile.read(filename,
+                                             Model.CACHE_VERSION))
+        phases['loadCache'] = time.perf_counter() - start
+        del index, packages
+        model = Model.Model(_ignore)
+        times = {name: benchmarkQuery(model, Model.Query(**kwargs),
+                                      repeat)
+                 for name, kwargs in queries(seed).items()}
+    return dict(packages=count, bytes=size, phases=phases,
+                readMBPerSecond=throughput, queries=times)
+
+
+def benchmarkQuery(model, query, repeat):
+    result = dict(matches=model.count(query))
+    for name, function in (
+            ('query', lambda: model.query(query)),
+            ('count', lambda: model.count(query)),
+            ('sectionCounts', lambda: model.sectionCounts(query)),
+            ('firstPageBySize', lambda: list(model.iterQuery(
+                query, order=Model.Order.SIZE, limit=100)))):
+        for warm in (False, True):
+            best = None
+            for _ in range(repeat):
+                if not warm:
+                    model._index._queryCache.clear()
+                    Model._canonicalWords.cache_clear()
+                start = time.perf_counter()
+                function()
+                elapsed = time.perf_counter() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            result[f'{name}:{"warm" if warm else "cold"}'] = best
+    return result
+
+
+def compare(old, new):
+    oldForCount = {size['packages']: size for size in old['sizes']}
+    for size in new['sizes']:
+        oldSize = oldForCount.get(size['packages'])
+        if oldSize is None:
+            continue
+        print(f'{size["packages"]:,d} packages (new/old):', file=sys.stderr)
+        for phase, value in size['phases'].items():
+            _printRatio(phase, value, oldSize['phases'].get(phase))
+        for name, times in size['queries'].items():
+            oldTimes = oldSize['queries'].get(name, {})
+            for key, value in times.items():
+                if key != 'matches':
+                    _printRatio(f'{name} {key}', value, oldTimes.get(key))
+
+
+def _printRatio(name, new, old):
+    if old:
+        print(f'  {name:40} {new / old:6.2f}', file=sys.stderr)
+
+
+def _mbPerSecond(size, seconds):
+    return size / seconds / 1_000_000
+
+
+def _compressors():
+    if importlib.util.find_spec('lz4') is None:
+        return '.gz,.xz,.bz2'
+    return '.gz,.xz,.bz2,.lz4'
+
+
+def _ignore(message, done):
+    pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# Copyright © 2020 Qtrac Ltd. All rights reserved.
+
+'''Benchmarks DebFind's cold start and writes the results as JSON,
+optionally comparing them with a previous run's.
+
+For each entry module it reports the import time given by python3 -X
+importtime (in microseconds) and the modules it imports that take the
+most time themselves. If wxPython and a display are available it also
+times how long it takes from starting python3 to the main window being
+shown (the model is loaded after that). Every time is the best of
+--repeat runs.
+'''
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+
+MODULES = ('Window', 'DebFindCli', 'Client', 'Model')
+TIMEOUT = 60 # seconds
+
+# Shows the main window just as DebFind.pyw does, then reports and quits
+# (before the model is loaded, which only starts 100ms after showing)
+_TO_WINDOW = '''\
+import wx
+import Window
+app = wx.App()
+app.AppName = 'DebFind'
+window = Window.Window(None)
+window.Show()
+def shown():
+    print('shown', flush=True)
+    window.Destroy()
+wx.CallAfter(shown)
+app.MainLoop()
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark DebFind's import time and time to window.")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='time each this many times and keep the best '
+                        '[default: %(default)s]')
+    parser.add_argument('-t', '--top', type=int, default=10,
+                        help='report this many of the slowest imported '
+                        'modules [default: %(default)s]')
+    parser.add_argument('-o', '--output',
+                        help='write the JSON results here rather than to '
+                        'stdout')
+    parser.add_argument('-c', '--compare', metavar='JSON',
+                        help="report each time as a ratio of this earlier "
+                        "run's (on stderr)")
+    args = parser.parse_args()
+    results = dict(python=platform.python_version(),
+                   platform=platform.platform(), repeat=args.repeat,
+                   imports={module: importTime(module, args.repeat,
+                                               args.top)
+                            for module in MODULES},
+                   timeToWindow=timeToWindow(args.repeat))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'wt', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, 'rt', encoding='utf-8') as file:
+            compare(json.load(file), results)
+
+
+def importTime(module, repeat, top):
+    '''Returns a dict of the best total import time of module and the top
+    modules it imports by their own import time (from the same run), or
+    of the error if module can't be imported'''
+    best = None
+    for _ in range(repeat):
+        process = _run(['-X', 'importtime', '-c', f'import {module}'])
+        if process.returncode:
+            lines = process.stderr.strip().splitlines()
+            return dict(error=lines[-1] if lines else 'failed')
+        total, microseconds = _importTimes(process.stderr, module)
+        if best is None or total < best[0]:
+            best = total, microseconds
+    total, microseconds = best
+    slowest = sorted(microseconds.items(), key=lambda item: item[1],
+                     reverse=True)[:top]
+    return dict(total=total, slowest=dict(slowest))
+
+
+def timeToWindow(repeat):
+    '''Returns the best number of seconds from starting python3 to the
+    main window being shown, or None if it couldn't be shown'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with subprocess.Popen(
+                [sys.executable, '-c', _TO_WINDOW], stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL, text=True,
+                cwd=_directory()) as process:
+            shown = process.stdout.readline().strip() == 'shown'
+            elapsed = time.perf_counter() - start
+            try:
+                process.wait(TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if not shown:
+            print('Failed to show the window (is there a display and is '
+                  'wxPython installed?)', file=sys.stderr)
+            return None
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def compare(old, new):
+    print('new/old:', file=sys.stderr)
+    for module, times in new['imports'].items():
+        oldTimes = old['imports'].get(module, {})
+        _printRatio(f'import {module}', times.get('total'),
+                    oldTimes.get('total'))
+    _printRatio('time to window', new['timeToWindow'], old['timeToWindow'])
+
+
+def _run(options):
+    return subprocess.run([sys.executable] + options, capture_output=True,
+                          text=True, cwd=_directory(), timeout=TIMEOUT)
+
+
+def _directory():
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def _importTimes(text, module):
+    '''Returns module's total import time and a dict of the modules it
+    imports with the time each took itself (in microseconds), from the
+    output of python3 -X importtime'''
+    microseconds = {}
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        selfTime, cumulative, name = line[len('import time:'):].split(
+            '|')
+        if not selfTime.strip().isdigit(): # The heading
+            continue
+        if name.startswith('  '): # Imported by the next top-level import
+            microseconds[name.strip()] = int(selfTime)
+        elif name.strip() == module:
+            return int(cumulative), microseconds
+        else: # Imported when python3 started
+            microseconds = {}
+    raise ValueError(f'no import time for {module}')
+
+
+def _printRatio(name, new, old):
+    if new and old:
+        print(f'  {name:40} {new / old:6.2f}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
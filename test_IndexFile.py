@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# Copyright © 2020 Qtrac Ltd. All rights reserved.
+
+import array
+import os
+import random
+import tempfile
+
+import IndexFile
+from Postings import Postings
+
+
+VERSION = 1
+
+
+def main():
+    print('IndexFile tests')
+    random.seed(917)
+    strings = ['', 'a', 'zebra', 'café', 'naïve résumé'] + [
+        ''.join(random.choices('abcdefghij', k=random.randint(1, 20)))
+        for _ in range(1_000)]
+    numbers = array.array('I', random.sample(range(1_000_000), 5_000))
+    postings = Postings(random.sample(range(200_000), 50_000))
+    postingsForKey = {string: Postings(random.sample(range(70_000),
+                                                     random.randint(0, 99)))
+                      for string in strings}
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'test.index')
+        IndexFile.write(filename, dict(strings=strings, sorted=sorted(
+            set(strings)), empty=[], numbers=numbers, postings=postings,
+            table=postingsForKey), VERSION)
+        assert oct(os.stat(filename).st_mode & 0o777) == '0o644', \
+            'not world-readable'
+        parts = IndexFile.read(filename, VERSION)
+        assert list(parts['strings']) == strings, 'wrong strings'
+        assert parts['strings'][-1] == strings[-1], 'wrong negative index'
+        assert parts['strings'][2:9:3] == strings[2:9:3], 'wrong slice'
+        assert not parts['empty'], 'nonempty empty strings'
+        table = parts['sorted']
+        for string in strings:
+            assert table[table.find(string)] == string, 'wrong find'
+        assert table.find('missing') == -1, 'found missing string'
+        assert parts['numbers'] == numbers, 'wrong array'
+        assert parts['postings'] == postings, 'wrong postings'
+        assert dict(parts['table']) == postingsForKey, 'wrong table'
+        assert 'missing' not in parts['table'], 'found missing key'
+        assert parts['table'].nbytesFor('zebra') == len(
+            postingsForKey['zebra'].tobytes()), 'wrong nbytesFor'
+        unmapped = IndexFile.read(filename, VERSION,
+                                  unmapped={'strings'})['strings']
+        assert isinstance(unmapped, IndexFile.FileStringTable), \
+            'mapped unmapped strings'
+        assert list(unmapped) == strings, 'wrong unmapped strings'
+        # Replacing the file must not disturb the existing mapping
+        IndexFile.write(filename, dict(strings=['new']), VERSION)
+        assert list(parts['strings']) == strings, 'replaced mapped file'
+        assert unmapped[-1] == strings[-1], 'replaced unmapped file'
+        assert list(IndexFile.read(filename, VERSION)['strings']) == \
+            ['new'], 'wrong replacement'
+        try:
+            IndexFile.read(filename, VERSION + 1)
+            raise AssertionError('read wrong version')
+        except ValueError:
+            pass
+        assert os.listdir(dirname) == ['test.index'], 'temporary file left'
+    print('All OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,22 +2,44 @@
 # Copyright © 2020 Qtrac Ltd. All rights reserved.
 
 import sys
+import threading
+import time
 
 import Model
-from Model import Deb # Needed for reading pickle
+import Profiler
 
 
 def main():
     if len(sys.argv) > 1 and sys.argv[1] in {'-h', '--help'}:
-        raise SystemExit('usage: test_Model.py [-d|--dump]')
+        raise SystemExit('usage: test_Model.py [-d|--dump|-s|--stress|'
+                         '-p|--profile DIR]')
 
-    model = Model.Model(onReady)
+    profileDir = None
+    if len(sys.argv) > 2 and sys.argv[1] in {'-p', '--profile'}:
+        profileDir = Model.PROFILE_DIR = sys.argv[2]
+    events = Model.EventLog()
+    model = Model.Model(onReady, onEvent=events)
 
     if len(sys.argv) > 1 and sys.argv[1] in {'-d', '--dump'}:
         dumpIndexes(model)
         return
 
+    if len(sys.argv) > 1 and sys.argv[1] in {'-s', '--stress'}:
+        stress(model)
+        return
+
+    if profileDir is None:
+        test(model, events)
+    else:
+        with Profiler.profile(profileDir, 'query'):
+            test(model, events)
+        print(f'Wrote profiles to {profileDir}')
+
+
+def test(model, events):
     print('Model tests')
+    assert events and events[-1].phase == 'ready', 'missing events'
+    assert events[-1].items == len(model), 'wrong ready event'
     query = Model.Query() # Default is Match.ALL_WORDS for name & desc.
 
     query.clear()
@@ -186,6 +208,176 @@ def main():
     names = model.query(query) # Any
     check(25, query, names, minimum=0, maximum=0)
 
+    query.clear()
+    query.section = 'python'
+    query.nameWords = 'django'
+    names, countForSection = model.query(query, sectionCounts=True)
+    check(26, query, names, {'python3-django'}, 5)
+    assert countForSection['python'] == len(names), 'wrong section count'
+    assert all(countForSection.values()), 'zero section count'
+
+    hits = model.cacheInfo.hits
+    query.nameWords = 'django  django'
+    names = model.query(query) # Same canonical query as 26
+    check(27, query, names, {'python3-django'}, 5)
+    assert model.cacheInfo.hits > hits, 'query cache missed'
+
+    query.clear()
+    query.section = 'python'
+    names = model.query(query)
+    assert list(model.iterQuery(query)) == sorted(names), 'wrong order'
+    page = list(model.iterQuery(query, limit=10, offset=5))
+    assert page == sorted(names)[5:15], 'wrong page'
+    bySize = [model.debForName(name).size for name in
+              model.iterQuery(query, order=Model.Order.SIZE)]
+    assert bySize == sorted(bySize), 'wrong size order'
+    query.section = ''
+    bySection = [model.debForName(name).section for name in
+                 model.iterQuery(query, order=Model.Order.SECTION,
+                                 reverse=True)]
+    assert bySection == sorted(bySection, reverse=True), \
+        'wrong section order'
+    query.section = 'python'
+    check(28, query, set(model.iterQuery(query,
+                                         order=Model.Order.RELEVANCE)),
+          {'python3'}, len(names), len(names))
+
+    query.clear()
+    query.section = 'editors'
+    query.maxSize = 1024 # KiB
+    names = model.query(query)
+    check(29, query, names)
+    assert all(model.debForName(name).size <= 1024 for name in names), \
+        'wrong size'
+
+    queries = [Model.Query(descWords=words, descMatch=match,
+                           section=section)
+               for words in ('haskell numbers', 'haskell daemon')
+               for match in Model.Match for section in ('', 'python')]
+    assert model.queryMany(queries) == [model.query(query)
+                                        for query in queries], \
+        'wrong queryMany'
+    assert model.queryMany(queries, workers=4) == model.queryMany(
+        queries), 'wrong threaded queryMany'
+    assert model.queryMany(query for query in queries) == model.queryMany(
+        queries), 'wrong queryMany of a generator'
+
+    native = Model._nativeArch()
+    assert native in model.allArchs, 'native arch not indexed'
+    query = Model.Query(nameWords='python3', arch=native)
+    names = model.query(query)
+    check(30, query, names, {'python3'}, 1,
+          len(model.query(Model.Query(nameWords='python3'))))
+    assert native in model.archsForName('python3'), 'wrong archs'
+    query.arch = 'no-such-arch'
+    assert all(Model.ALL_ARCH in model.archsForName(name)
+               for name in model.query(query)), 'wrong foreign arch'
+
+    key = Model._versionKey
+    assert key('1:1.0') > key('2.0') > key('2.0~rc1') > key('1.10') > \
+        key('1.9-2') > key('1.9-1ubuntu1') > key('1.9-1'), 'wrong versions'
+    assert key('1.0') == key('1.0-0'), 'wrong missing revision'
+    assert key('0') > key('00~-227') and key('0') > key('0~25-107'), \
+        'wrong end of version'
+    versions = model.versionsForName('python3')
+    assert versions and versions[0][0] == model.debForName(
+        'python3').version, 'wrong candidate version'
+    keys = [key(version) for version, _ in versions]
+    assert keys == sorted(keys, reverse=True), 'versions out of order'
+
+    testForeignVersion()
+
+    query = Model.Query(includeLibs=True, includeDocs=True)
+    total = model.count(query)
+    query.installed = Model.Installed.INSTALLED
+    installed = model.query(query)
+    query.installed = Model.Installed.UPGRADABLE
+    upgradable = model.query(query)
+    assert upgradable <= installed, 'upgradable but not installed'
+    query.installed = Model.Installed.NOT_INSTALLED
+    assert model.count(query) + len(installed) == total, 'wrong installed'
+    assert all(model.installedVersion(name) for name in installed), \
+        'missing installed version'
+    assert set(model.installedStates(sorted(upgradable))) <= {
+        Model.Installed.UPGRADABLE}, 'wrong installed states'
+
+    query = Model.Query(includeLibs=True, includeDocs=True,
+                        dependsOn='libc6')
+    direct = model.query(query)
+    assert direct, 'nothing depends on libc6'
+    query.transitive = True
+    assert model.query(query) >= direct, 'transitive missing direct'
+    name = min(direct)
+    query = Model.Query(includeLibs=True, includeDocs=True,
+                        requiredBy=name)
+    required = model.query(query)
+    assert 'libc6' in required, 'wrong required by'
+    query.relations |= Model.Relation.SUGGESTS
+    assert model.query(query) >= required, 'wrong relations'
+    # Virtual packages stand for their providers (cf.
+    # Corpus.VIRTUAL_PACKAGES)
+    query = Model.Query(includeLibs=True, includeDocs=True,
+                        dependsOn='mail-transport-agent')
+    assert model.count(query), 'nothing depends on a virtual package'
+
+    assert model.queryStats is None, 'query stats enabled by default'
+    model.enableQueryStats(slowSeconds=0) # Log every query
+    query = Model.Query(descWords='haskell numbers', section='haskell')
+    names = model.query(query)
+    assert model.count(query) == len(names), 'wrong count'
+    stats = model.queryStats
+    assert stats['count'] == 2, 'wrong query stats count'
+    assert sum(stats['histogramForStage']['total']) == 2, 'wrong histogram'
+    assert stats['slowQueries'][0]['size'] == len(names), 'wrong slow log'
+    assert stats['slowQueries'][1]['plan'] == [['cached', len(names)]], \
+        'wrong plan'
+    model.disableQueryStats()
+
+    # A staged rebuild returns at once and can be queried as soon as
+    # onNamesReady() is called
+    namesReady = threading.Event()
+    staged = Model.Model(onReady, refresh=True, staged=True,
+                         onNamesReady=namesReady.set)
+    assert namesReady.wait(60), 'names never ready'
+    assert staged.stage in set(Model.Stage), 'wrong stage'
+    query = Model.Query(nameWords='python3')
+    assert staged.query(query) == model.query(query), 'wrong staged names'
+    query = Model.Query(descWords='haskell numbers')
+    assert staged.query(query) == model.query(query), 'wrong staged descs'
+    assert staged.stage is Model.Stage.ALL, 'descriptions not indexed'
+
+    report = model.memoryReport
+    assert report['packages'] == len(model), 'wrong memory report'
+    assert sum(report['fields']['desc'].values()) > 0, 'no desc memory'
+    assert sum(bucket['terms'] for bucket in report['termBuckets'][
+        'name']) > 0, 'no name terms'
+
+
+def testForeignVersion():
+    '''A foreign arch's higher version (e.g., a binNMU) is only listed:
+    the native variant is the candidate, and isn't upgradable to it'''
+    native = Model._nativeArch()
+    foreign = 'arm64' if native != 'arm64' else 'amd64'
+    relations = ('libc6', '', '', '', '')
+    prefix = 'deb.debian.org_debian_dists_bookworm_main_binary-'
+    packages = Model._merge({
+        f'{prefix}{native}_Packages': [(Model.Deb(
+            'foo', '1.0-1', 'utils', 'Foo', '', 10), native, relations)],
+        f'{prefix}{foreign}_Packages': [(Model.Deb(
+            'foo', '1.0-1+b1', 'utils', 'Foo', '', 20), foreign,
+                                        ('', '', '', '', ''))]}, [])
+    index = Model._Index(packages, _ignore).withInstalled(
+        None, {'foo': '1.0-1'})
+    assert index.debForName('foo').size == 10, 'foreign candidate'
+    assert [version for version, _ in index.versionsForName('foo')] == [
+        '1.0-1', '1.0-1+b1'], 'wrong foreign versions'
+    assert index.installedState('foo') is Model.Installed.INSTALLED, \
+        'upgradable to a foreign version'
+
+
+def _ignore(*_):
+    pass
+
 
 def onReady(message, done):
     print(message)
@@ -193,20 +385,59 @@ def onReady(message, done):
         print('Ready.')
 
 
+def stress(model, *, readers=8, refreshes=5):
+    '''Runs queries in parallel threads while the model is repeatedly
+    refreshed and checks that every result matches the expected one'''
+    print(f'Stress test: {readers} reader threads, {refreshes} refreshes')
+    queries = [Model.Query(descWords=words, descMatch=match,
+                           section=section, includeLibs=True)
+               for words in ('haskell numbers', 'python django', 'editor')
+               for match in Model.Match for section in ('', 'python')]
+    expected = [model.query(query) for query in queries]
+    errors = []
+    counts = []
+    done = threading.Event()
+
+    def reader():
+        count = 0
+        while not done.is_set():
+            for query, names in zip(queries, expected):
+                try:
+                    if model.query(query) != names:
+                        errors.append(f'wrong names for "{query}"')
+                    if len(list(model.iterQuery(query))) != len(names):
+                        errors.append(f'wrong iterQuery for "{query}"')
+                except Exception as err:
+                    errors.append(f'{err!r} for "{query}"')
+                count += 1
+            time.sleep(0.001) # Leave some CPU for the loader's workers
+        counts.append(count)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for _ in range(refreshes):
+        model.load(onReady, refresh=True)
+    done.set()
+    for thread in threads:
+        thread.join()
+    assert not errors, f'{len(errors):,d} errors, e.g., {errors[0]}'
+    print(f'{sum(counts):,d} queries OK')
+
+
 def dumpIndexes(model):
     with open('allnames.txt', 'wt', encoding='utf-8') as file:
         for name in sorted(model.allNames):
             print(name, file=file)
-    with open('stemmednames.txt', 'wt', encoding='utf-8') as file:
-        for name, words in sorted(model._namesForStemmedName.items()):
-            print(name, ', '.join(sorted(words)), file=file)
-    with open('stemmeddescs.txt', 'wt', encoding='utf-8') as file:
-        for name, words in sorted(
-                model._namesForStemmedDesc.items()):
-            print(name, ', '.join(sorted(words)), file=file)
-    with open('sections.txt', 'wt', encoding='utf-8') as file:
-        for name, words in sorted(model._namesForSection.items()):
-            print(name, ', '.join(sorted(words)), file=file)
+    for filename, idsForKey in (
+            ('stemmednames.txt', model._index._idsForStemmedName),
+            ('stemmeddescs.txt', model._index._idsForStemmedDesc),
+            ('sections.txt', model._index._idsForSection),
+            ('archs.txt', model._index._idsForArch)):
+        with open(filename, 'wt', encoding='utf-8') as file:
+            for key, ids in sorted(idsForKey.items()):
+                print(key, ', '.join(model._index._names[id]
+                                     for id in ids), file=file)
     print('Dumped indexes.')
 
 
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# Copyright © 2020 Qtrac Ltd. All rights reserved.
+
+import pickle
+import random
+
+from Postings import ARRAY_MAX, CHUNK_SIZE, Postings
+
+
+def main():
+    print('Postings tests')
+    random.seed(917)
+    size = (CHUNK_SIZE * 2) + 1_000
+    for id, count in enumerate((0, 10, ARRAY_MAX, ARRAY_MAX + 1, 20_000,
+                                100_000), 1):
+        a = set(random.sample(range(size), count))
+        b = set(random.sample(range(size), random.randint(0, 50_000)))
+        check(id, a, b)
+    everything = Postings.fromRange(size)
+    assert len(everything) == size, 'wrong range length'
+    assert list(everything) == list(range(size)), 'wrong range'
+    assert not Postings.fromRange(0), 'nonempty empty range'
+    print('All OK')
+
+
+def check(id, a, b):
+    print(f'{id:2d} {len(a):,d} & {len(b):,d} ', end='')
+    ap = Postings(a)
+    bp = Postings(b)
+    assert list(ap) == sorted(a), 'wrong order'
+    assert len(ap) == len(a), 'wrong length'
+    assert set(ap & bp) == (a & b), 'wrong AND'
+    assert set(ap | bp) == (a | b), 'wrong OR'
+    assert set(ap - bp) == (a - b), 'wrong ANDNOT'
+    assert ap.intersectionCount(bp) == len(a & b), 'wrong count'
+    assert all(x in ap for x in b) == b.issubset(a), 'wrong contains'
+    assert Postings.frombytes(ap.tobytes()) == ap, 'wrong bytes'
+    assert pickle.loads(pickle.dumps(ap)) == ap, 'wrong pickle'
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()